@@ -1,5 +1,5 @@
 """Модуль для работы с таблицей городов."""
-from dbtable import DbTable
+from dbtable import DbTable, retrying
 
 
 class CityTable(DbTable):
@@ -14,6 +14,7 @@ class CityTable(DbTable):
         return {
             "id": ["SERIAL", "PRIMARY KEY"],
             "name": ["VARCHAR(100)", "NOT NULL", "UNIQUE"],
+            "version": ["INT", "NOT NULL", "DEFAULT 1"],
         }
 
     def validate_city_name(self, name):
@@ -24,6 +25,7 @@ class CityTable(DbTable):
             return False, "Название слишком длинное (максимум 100)!"
         return True, ""
 
+    @retrying(False)
     def check_city_exists(self, name):
         """Проверка существования города."""
         sql = f"SELECT COUNT(*) FROM {self.table_name()} WHERE name = %s"
@@ -32,6 +34,7 @@ class CityTable(DbTable):
         result = cur.fetchone()
         return result[0] > 0
 
+    @retrying(False, idempotent=False)
     def insert_one(self, vals):
         """Вставка города с валидацией."""
         valid, error = self.validate_city_name(vals[0])
@@ -43,7 +46,8 @@ class CityTable(DbTable):
             return False
         return super().insert_one(vals)
 
-    def update_by_id(self, id_val, vals):
+    @retrying(False, idempotent=False)
+    def update_by_id(self, id_val, vals, expected_version=None):
         """Обновление города с валидацией."""
         valid, error = self.validate_city_name(vals[0])
         if not valid:
@@ -58,17 +62,12 @@ class CityTable(DbTable):
         if cur.fetchone()[0] > 0:
             print("Город с таким названием уже существует!")
             return False
-        return super().update_by_id(id_val, vals)
+        return super().update_by_id(id_val, vals, expected_version)
 
+    @retrying(False, idempotent=False)
     def delete_by_id(self, id_val):
         """Удаление города с проверкой связей."""
-        sql = (
-            f"SELECT COUNT(*) FROM {self.dbconn.prefix}route "
-            "WHERE departure_city_id = %s"
-        )
-        cur = self.dbconn.conn.cursor()
-        cur.execute(sql, (id_val,))
-        count = cur.fetchone()[0]
+        count = self.routes_count_by_city_ids([id_val]).get(id_val, 0)
         if count > 0:
             print(
                 f"Невозможно удалить: существует {count} маршрут(ов)!"
@@ -76,3 +75,77 @@ class CityTable(DbTable):
             print("Сначала удалите связанные маршруты.")
             return False
         return super().delete_by_id(id_val)
+
+    @retrying([], idempotent=False)
+    def update_many(self, items, columns=None):
+        """Массовое обновление городов с валидацией.
+
+        Уникальность названий проверяется внутри набора и одним
+        запросом к БД для всего набора.
+        """
+        cols = columns or self.column_names_without_id()
+        if "name" not in cols:
+            return super().update_many(items, columns)
+        idx = cols.index("name")
+        names = {}
+        for id_val, vals in items:
+            name = vals[idx]
+            valid, error = self.validate_city_name(name)
+            if not valid:
+                print(error)
+                return []
+            if names.setdefault(name, id_val) != id_val:
+                print("Город с таким названием уже существует!")
+                return []
+        sql = (
+            f"SELECT COUNT(*) FROM {self.table_name()} "
+            "WHERE name = ANY(%s) AND NOT id = ANY(%s)"
+        )
+        cur = self.dbconn.conn.cursor()
+        cur.execute(sql, (list(names), [id_val for id_val, _ in items]))
+        if cur.fetchone()[0] > 0:
+            print("Город с таким названием уже существует!")
+            return []
+        return super().update_many(items, columns)
+
+    @retrying({})
+    def routes_count_by_city_ids(self, ids):
+        """Количество маршрутов для каждого города из списка.
+
+        Учитываются маршруты, которые отправляются из города или
+        проходят через него (RouteCity). Возвращает словарь
+        {id города: количество} только для городов, у которых есть
+        маршруты.
+        """
+        p = self.dbconn.prefix
+        sql = (
+            "SELECT city_id, COUNT(*) FROM ("
+            f"SELECT departure_city_id, id FROM {p}route "
+            "WHERE departure_city_id = ANY(%s) "
+            f"UNION SELECT city_id, route_id FROM {p}routecity "
+            "WHERE city_id = ANY(%s)"
+            ") u (city_id, route_id) "
+            "GROUP BY city_id"
+        )
+        cur = self.dbconn.conn.cursor()
+        cur.execute(sql, (list(ids), list(ids)))
+        return dict(cur.fetchall())
+
+    @retrying([], idempotent=False)
+    def delete_many(self, ids):
+        """Массовое удаление городов с проверкой связей.
+
+        Города с маршрутами не удаляются; их ID выводятся в сообщении.
+        Возвращает список ID удаленных городов.
+        """
+        blocked = self.routes_count_by_city_ids(ids)
+        if blocked:
+            print(
+                "Невозможно удалить города с маршрутами (ID): "
+                + ", ".join(str(i) for i in sorted(blocked))
+            )
+            print("Сначала удалите связанные маршруты.")
+        allowed = [i for i in ids if i not in blocked]
+        if not allowed:
+            return []
+        return super().delete_many(allowed)
@@ -1,10 +1,28 @@
 """Модуль для установки соединения с базой данных PostgreSQL."""
+import json
+import random
+import select
+import threading
+import time
+
 import psycopg2
+import psycopg2.errors
 
 
 class DbConnection:
     """Класс для управления подключением к базе данных."""
 
+    CHANGE_CHANNEL = "table_changes"
+    RETRY_ATTEMPTS = 6
+    BACKOFF_BASE = 0.1
+    BACKOFF_MAX = 2.0
+    CONNECT_TIMEOUT = 5
+    KEEPALIVES_IDLE = 10
+    KEEPALIVES_INTERVAL = 5
+    KEEPALIVES_COUNT = 3
+    TCP_USER_TIMEOUT = 15000
+    PING_IDLE = 30.0
+
     def __init__(self, config):
         """Инициализация подключения к БД."""
         self.dbname = config.dbname
@@ -12,14 +30,195 @@ class DbConnection:
         self.password = config.password
         self.host = config.host
         self.prefix = config.dbtableprefix
-        self.conn = psycopg2.connect(
+        self.stats = {
+            "reconnects": 0,
+            "read_retries": 0,
+            "transaction_retries": 0,
+            "failures": 0,
+        }
+        self._conn = self.connect()
+        self.last_used = time.monotonic()
+
+    @property
+    def conn(self):
+        """Текущее соединение; закрытое соединение открывается заново.
+
+        Соединение, простоявшее без дела дольше PING_IDLE секунд,
+        перед использованием проверяется ping(): полуоткрытое
+        соединение закрывается и заменяется новым.
+        """
+        if (
+            self._conn is not None
+            and not self._conn.closed
+            and time.monotonic() - self.last_used > self.PING_IDLE
+            and self._conn.info.transaction_status
+            == psycopg2.extensions.TRANSACTION_STATUS_IDLE
+            and not self.ping()
+        ):
+            self._conn.close()
+        if self._conn is None or self._conn.closed:
+            self.reconnect()
+        self.last_used = time.monotonic()
+        return self._conn
+
+    def reconnect(self):
+        """Замена закрытого соединения новым.
+
+        Неудачная попытка оставляет прежнее закрытое соединение,
+        поэтому следующее обращение к conn повторит подключение.
+        """
+        self._conn = self.connect()
+        self.stats["reconnects"] += 1
+
+    def backoff(self, attempt):
+        """Пауза перед повтором с джиттером."""
+        delay = min(self.BACKOFF_MAX, self.BACKOFF_BASE * 2 ** attempt)
+        time.sleep(delay * random.uniform(0.5, 1.5))
+
+    def rollback(self):
+        """Откат текущей транзакции, если соединение открыто."""
+        if self._conn is not None and not self._conn.closed:
+            self._conn.rollback()
+
+    def ping(self):
+        """Проверка работоспособности соединения запросом SELECT 1."""
+        if self._conn is None or self._conn.closed:
+            return False
+        try:
+            cur = self._conn.cursor()
+            cur.execute("SELECT 1")
+            self._conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def is_transient(self, e):
+        """Является ли ошибка временной: обрыв связи или конфликт."""
+        if isinstance(e, (
+            psycopg2.errors.SerializationFailure,
+            psycopg2.errors.DeadlockDetected,
+        )):
+            return True
+        return isinstance(
+            e, (psycopg2.OperationalError, psycopg2.InterfaceError)
+        ) and bool(self._conn is None or self._conn.closed)
+
+    def run(self, fn, idempotent=True):
+        """Выполнение fn с повтором при временных ошибках.
+
+        Ошибки сериализации и взаимоблокировки откатывают транзакцию
+        целиком, поэтому она повторяется всегда. При обрыве связи
+        повторяются только идемпотентные операции (idempotent=True):
+        для записи неизвестно, была ли она зафиксирована. Между
+        попытками выдерживается пауза backoff(); новое соединение
+        открывается при следующем обращении к conn.
+        """
+        for attempt in range(self.RETRY_ATTEMPTS + 1):
+            try:
+                return fn()
+            except Exception as e:
+                lost = bool(self._conn.closed)
+                if not lost:
+                    self._conn.rollback()
+                if not self.is_transient(e):
+                    raise
+                if attempt == self.RETRY_ATTEMPTS or (lost and not idempotent):
+                    self.stats["failures"] += 1
+                    raise
+                if lost:
+                    self.stats["read_retries"] += 1
+                else:
+                    self.stats["transaction_retries"] += 1
+                self.backoff(attempt)
+
+    def connect(self):
+        """Открытие нового соединения с параметрами конфигурации.
+
+        connect_timeout ограничивает время подключения, а TCP keepalive
+        и tcp_user_timeout закрывают соединение, если сервер перестал
+        отвечать, вместо бесконечного ожидания.
+        """
+        return psycopg2.connect(
             dbname=self.dbname,
             user=self.user,
             password=self.password,
             host=self.host,
+            connect_timeout=self.CONNECT_TIMEOUT,
+            keepalives=1,
+            keepalives_idle=self.KEEPALIVES_IDLE,
+            keepalives_interval=self.KEEPALIVES_INTERVAL,
+            keepalives_count=self.KEEPALIVES_COUNT,
+            tcp_user_timeout=self.TCP_USER_TIMEOUT,
         )
 
+    def listen(self, channel=CHANGE_CHANNEL, timeout=None, stop=None):
+        """Генератор событий изменения таблиц.
+
+        Слушает канал на отдельном соединении и возвращает события
+        вида {"table": ..., "op": ..., "id": ...}. Если задан timeout,
+        генератор завершается после timeout секунд без событий.
+        stop - необязательный threading.Event для остановки.
+
+        При обрыве соединения генератор переподключается с паузой
+        backoff(), заново выполняет LISTEN и возвращает событие
+        {"table": None, "op": "RECONNECT", "id": None}: оповещения,
+        отправленные во время обрыва, потеряны.
+        """
+        wait = 0.5 if stop is not None else timeout
+        attempt = 0
+        connected = False
+        while stop is None or not stop.is_set():
+            conn = None
+            try:
+                conn = self.connect()
+                conn.set_isolation_level(
+                    psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT
+                )
+                cur = conn.cursor()
+                cur.execute(f"LISTEN {channel}")
+                if connected:
+                    self.stats["reconnects"] += 1
+                    yield {"table": None, "op": "RECONNECT", "id": None}
+                connected = True
+                attempt = 0
+                idle = 0.0
+                while stop is None or not stop.is_set():
+                    if select.select([conn], [], [], wait) == ([], [], []):
+                        idle += wait or 0
+                        if timeout is not None and idle >= timeout:
+                            return
+                        continue
+                    idle = 0.0
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        yield json.loads(notify.payload)
+                return
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                if not connected:
+                    raise
+                self.backoff(attempt)
+                attempt = min(attempt + 1, self.RETRY_ATTEMPTS)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+    def subscribe(self, callback, channel=CHANGE_CHANNEL):
+        """Подписка на события изменения таблиц в фоновом потоке.
+
+        callback вызывается для каждого события. Возвращает
+        threading.Event, установка которого завершает подписку.
+        """
+        stop = threading.Event()
+
+        def run():
+            for event in self.listen(channel, stop=stop):
+                callback(event)
+
+        threading.Thread(target=run, daemon=True).start()
+        return stop
+
     def __del__(self):
         """Закрытие соединения при удалении объекта."""
-        if self.conn:
-            self.conn.close()
+        if getattr(self, "_conn", None):
+            self._conn.close()
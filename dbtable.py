@@ -1,14 +1,175 @@
 """Базовый класс для работы с таблицами базы данных."""
+import copy
+import functools
+import gzip
+import json
+import os
+from collections import namedtuple
+from contextlib import contextmanager
+
+import psycopg2.extensions
+import psycopg2.extras
+
 from dbconnection import DbConnection
+from snapshot import Snapshot
+
+
+def _numeric_to_cents(value, cur):
+    """Преобразование NUMERIC в целое число копеек."""
+    if value is None:
+        return None
+    whole, _, frac = value.partition(".")
+    return int(whole + (frac + "00")[:2])
+
+
+NUMERIC_FLOAT = psycopg2.extensions.new_type(
+    psycopg2.extensions.DECIMAL.values,
+    "NUMERIC_FLOAT",
+    lambda value, cur: None if value is None else float(value),
+)
+NUMERIC_CENTS = psycopg2.extensions.new_type(
+    psycopg2.extensions.DECIMAL.values, "NUMERIC_CENTS", _numeric_to_cents
+)
+
+
+class RowCursor(psycopg2.extensions.cursor):
+    """Курсор, возвращающий строки в виде объектов row_class."""
+
+    row_class = None
+
+    def fetchone(self):
+        """Получение одной строки."""
+        row = super().fetchone()
+        return None if row is None else self.row_class._make(row)
+
+    def fetchmany(self, size=None):
+        """Получение нескольких строк."""
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        return list(map(self.row_class._make, rows))
+
+    def fetchall(self):
+        """Получение всех строк."""
+        return list(map(self.row_class._make, super().fetchall()))
+
+    def __iter__(self):
+        """Итерация по строкам результата."""
+        return map(self.row_class._make, super().__iter__())
+
+
+class ChunkWriter:
+    """Буфер записи, передающий данные в приемник блоками size байт."""
+
+    def __init__(self, sink, size):
+        """Инициализация буфера."""
+        self.sink = sink
+        self.size = size
+        self.buf = bytearray()
+
+    def write(self, data):
+        """Добавление данных с выгрузкой заполненных блоков."""
+        self.buf += data
+        while len(self.buf) >= self.size:
+            self.sink.write(self.buf[:self.size])
+            del self.buf[:self.size]
+        return len(data)
+
+    def flush(self):
+        """Выгрузка остатка буфера."""
+        if self.buf:
+            self.sink.write(bytes(self.buf))
+            self.buf.clear()
+
+
+def retrying(default=None, idempotent=True):
+    """Декоратор метода таблицы с повтором при временных ошибках БД.
+
+    Метод выполняется через DbConnection.run(). Если повторы не
+    помогли, выводится сообщение и возвращается копия default.
+    Обработчики ошибок внутри метода должны пробрасывать временные
+    ошибки (см. DbConnection.is_transient), а при остальных ошибках
+    откатывать транзакцию, чтобы соединение оставалось пригодным
+    для следующих запросов. ValueError - ошибка
+    вызова, а не БД, она передается вызывающему коду.
+    """
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            try:
+                return self.dbconn.run(
+                    lambda: method(self, *args, **kwargs), idempotent
+                )
+            except ValueError:
+                raise
+            except Exception as e:
+                print(f"Ошибка выполнения запроса: {e}")
+                return copy.copy(default)
+        return wrapper
+    return decorate
+
+
+class BulkLoadRestoreError(Exception):
+    """Ошибка восстановления индексов и ограничений после загрузки.
+
+    failures - список пар (запрос, текст ошибки) неудавшихся шагов.
+    """
+
+    def __init__(self, failures):
+        """Сохранение неудавшихся шагов восстановления."""
+        self.failures = failures
+        super().__init__(
+            "Не восстановлено после загрузки: "
+            + "; ".join(f"{sql}: {error}" for sql, error in failures)
+        )
+
+
+class UpdateResult:
+    """Результат успешного обновления версионируемой записи.
+
+    Истинен в логическом контексте, как и True. version - новая
+    версия записи для следующего обновления без повторного чтения.
+    """
+
+    def __init__(self, version):
+        """Сохранение новой версии записи."""
+        self.version = version
+
+    def __bool__(self):
+        """Обновление выполнено."""
+        return True
+
+
+class UpdateConflict:
+    """Результат обновления, отклоненного из-за изменения записи.
+
+    Ложен в логическом контексте, как и неудачное обновление.
+    current - текущая строка записи или None, если она удалена.
+    """
+
+    def __init__(self, current):
+        """Сохранение текущего состояния записи."""
+        self.current = current
+
+    def __bool__(self):
+        """Конфликт не является успешным обновлением."""
+        return False
 
 
 class DbTable:
     """Базовый класс для операций с таблицами БД."""
 
+    VERSION_COLUMN = "version"
+
     dbconn: DbConnection | None = None
+    EXPORT_CHUNK = 1024 * 1024
+    _row_classes = {}
+
+    def __init__(self, numeric=None):
+        """Инициализация объекта таблицы.
 
-    def __init__(self):
-        """Инициализация объекта таблицы."""
+        numeric - способ чтения колонок NUMERIC: None (Decimal),
+        "float" или "cents" (целое число копеек).
+        """
+        self.numeric = numeric
 
     def table_name(self):
         """Получение имени таблицы."""
@@ -27,33 +188,418 @@ class DbTable:
         return ["id"]
 
     def column_names_without_id(self):
-        """Получение списка колонок без ID."""
+        """Получение списка колонок без ID и колонки версии."""
         res = sorted(self.columns().keys())
         if "id" in res:
             res.remove("id")
+        if self.version_column() in res:
+            res.remove(self.version_column())
         return res
 
+    def version_column(self):
+        """Получение имени колонки версии строки.
+
+        Версионирование включается объявлением колонки VERSION_COLUMN
+        в columns(), например "version": ["INT", "NOT NULL", "DEFAULT 1"].
+        Каждое обновление увеличивает версию на единицу.
+        """
+        if self.VERSION_COLUMN in self.columns():
+            return self.VERSION_COLUMN
+        return None
+
+    def row_class(self, extra=()):
+        """Получение класса строки таблицы.
+
+        Класс строится по columns() один раз для каждой таблицы;
+        extra - дополнительные колонки запроса после колонок таблицы.
+        """
+        key = (type(self), tuple(extra))
+        cls = self._row_classes.get(key)
+        if cls is None:
+            name = type(self).__name__.removesuffix("Table") + "Row"
+            cls = namedtuple(name, self.column_names() + list(extra))
+            self._row_classes[key] = cls
+        return cls
+
+    def select_list(self, alias=None):
+        """Список колонок таблицы для SELECT в порядке row_class()."""
+        prefix = alias + "." if alias else ""
+        return ", ".join(prefix + c for c in self.column_names())
+
+    def cursor(self, extra=()):
+        """Получение курсора, возвращающего строки класса row_class()."""
+        cur = self.dbconn.conn.cursor(cursor_factory=RowCursor)
+        cur.row_class = self.row_class(extra)
+        if self.numeric == "float":
+            psycopg2.extensions.register_type(NUMERIC_FLOAT, cur)
+        elif self.numeric == "cents":
+            psycopg2.extensions.register_type(NUMERIC_CENTS, cur)
+        return cur
+
     def table_constraints(self):
         """Получение дополнительных ограничений таблицы."""
         return []
 
-    def create(self):
-        """Создание таблицы в базе данных."""
+    def indexes(self):
+        """Описание вторичных индексов таблицы {имя: [колонки]}."""
+        return {}
+
+    def index_sql(self, name, cols):
+        """Запрос создания вторичного индекса."""
+        return (
+            f"CREATE INDEX IF NOT EXISTS {name} "
+            f"ON {self.table_name()} ({', '.join(cols)})"
+        )
+
+    def partitioning(self):
+        """Описание секционирования таблицы.
+
+        None - обычная таблица. Иначе словарь:
+        {"method": "HASH", "columns": [...], "partitions": N} или
+        {"method": "LIST", "columns": [...],
+        "partitions": {"суффикс": [значения], ...}, "default": True}.
+        """
+        return None
+
+    def partition_name(self, suffix):
+        """Получение имени секции таблицы по суффиксу."""
+        return f"{self.table_name()}_{suffix}"
+
+    def partition_bound(self, values):
+        """Формирование границ секции.
+
+        values - остаток от деления для HASH, список значений
+        для LIST, None для секции по умолчанию.
+        """
+        part = self.partitioning()
+        if values is None:
+            return "DEFAULT"
+        if part["method"] == "HASH":
+            return (
+                f"FOR VALUES WITH (MODULUS {part['partitions']}, "
+                f"REMAINDER {int(values)})"
+            )
+        return "FOR VALUES IN (" + ", ".join(["%s"] * len(values)) + ")"
+
+    def partition_bounds(self):
+        """Получение суффиксов и значений всех объявленных секций."""
+        part = self.partitioning()
+        if not part:
+            return {}
+        if part["method"] == "HASH":
+            return {f"p{i}": i for i in range(part["partitions"])}
+        res = dict(part["partitions"])
+        if part.get("default"):
+            res["default"] = None
+        return res
+
+    def create(self, notify=False):
+        """Создание таблицы в базе данных.
+
+        При объявленном partitioning() создается секционированная
+        таблица вместе со всеми секциями. Первичный ключ такой
+        таблицы дополняется колонками ключа секционирования.
+        При notify=True устанавливаются триггеры оповещения
+        об изменениях (см. install_notify). Для версионируемой
+        таблицы добавляются колонка версии, если таблица уже
+        существовала без нее, и триггер версии (см.
+        install_version_trigger) - в том числе когда существующую
+        таблицу не удалось дополнить секциями или индексами.
+        """
+        part = self.partitioning()
+        columns = self.columns()
+        constraints = self.table_constraints()
+        if part:
+            columns = {
+                k: [x for x in v if x != "PRIMARY KEY"]
+                for k, v in columns.items()
+            }
+            pk = self.primary_key() + [
+                c for c in part["columns"] if c not in self.primary_key()
+            ]
+            constraints = [f"PRIMARY KEY ({', '.join(pk)})"] + constraints
         sql = "CREATE TABLE IF NOT EXISTS " + self.table_name() + "("
         arr = [
             k + " " + " ".join(v)
-            for k, v in sorted(self.columns().items())
+            for k, v in sorted(columns.items())
         ]
-        sql += ", ".join(arr + self.table_constraints())
+        sql += ", ".join(arr + constraints)
         sql += ")"
+        if part:
+            sql += (
+                f" PARTITION BY {part['method']} "
+                f"({', '.join(part['columns'])})"
+            )
         cur = self.dbconn.conn.cursor()
         try:
             cur.execute(sql)
+            for suffix, values in self.partition_bounds().items():
+                cur.execute(
+                    "CREATE TABLE IF NOT EXISTS "
+                    f"{self.partition_name(suffix)} "
+                    f"PARTITION OF {self.table_name()} "
+                    f"{self.partition_bound(values)}",
+                    values if isinstance(values, list) else None,
+                )
+            for name, cols in self.indexes().items():
+                cur.execute(self.index_sql(name, cols))
             self.dbconn.conn.commit()
         except Exception as e:
             self.dbconn.conn.rollback()
             print(f"Ошибка создания таблицы: {e}")
+            if not self.exists():
+                return
+        if self.version_column():
+            self.install_version_trigger()
+        if notify:
+            self.install_notify()
+
+    def install_version_trigger(self):
+        """Установка колонки и триггера версии строки.
+
+        Колонка версии добавляется в таблицу, созданную без нее
+        (например, по task_1_2.txt). Обновление, не изменившее версию
+        (например, SQL-запрос в обход update_by_id), увеличивает ее
+        на единицу. Обновления через update_by_id и update_many уже
+        меняют версию и не увеличивают ее повторно. Поэтому метка
+        изменений для снимков (change_marker) учитывает любое
+        изменение строки.
+        """
+        version = self.version_column()
+        func = f"{self.dbconn.prefix}bump_{version}"
+        sql_list = [
+            f"ALTER TABLE {self.table_name()} ADD COLUMN IF NOT EXISTS "
+            f"{version} {' '.join(self.columns()[version])}",
+            f"CREATE OR REPLACE FUNCTION {func}() "
+            "RETURNS trigger AS $$ BEGIN "
+            f"IF NEW.{version} IS NOT DISTINCT FROM OLD.{version} THEN "
+            f"NEW.{version} := OLD.{version} + 1; "
+            "END IF; "
+            "RETURN NEW; END $$ LANGUAGE plpgsql",
+            f"DROP TRIGGER IF EXISTS bump_version_trg ON {self.table_name()}",
+            "CREATE TRIGGER bump_version_trg "
+            f"BEFORE UPDATE ON {self.table_name()} "
+            f"FOR EACH ROW EXECUTE FUNCTION {func}()",
+        ]
+        cur = self.dbconn.conn.cursor()
+        try:
+            for sql in sql_list:
+                cur.execute(sql)
+            self.dbconn.conn.commit()
+        except Exception as e:
+            self.dbconn.conn.rollback()
+            print(f"Ошибка установки триггера версии: {e}")
+
+    def install_notify(self):
+        """Установка триггера pg_notify на изменения таблицы.
+
+        Каждая вставка, изменение и удаление строки отправляет
+        в канал DbConnection.CHANGE_CHANNEL событие
+        {"table": ..., "op": ..., "id": ...}.
+        """
+        func = self.dbconn.prefix + "notify_table_change"
+        name = self.table_name()[len(self.dbconn.prefix):]
+        sql_list = [
+            f"CREATE OR REPLACE FUNCTION {func}() "
+            "RETURNS trigger AS $$ DECLARE rec RECORD; BEGIN "
+            "IF TG_OP = 'DELETE' THEN rec := OLD; ELSE rec := NEW; END IF; "
+            "PERFORM pg_notify(TG_ARGV[0], json_build_object("
+            "'table', TG_ARGV[1], 'op', TG_OP, "
+            "'id', to_jsonb(rec) -> 'id')::text); "
+            "RETURN NULL; END $$ LANGUAGE plpgsql",
+            f"DROP TRIGGER IF EXISTS notify_change_trg ON {self.table_name()}",
+            "CREATE TRIGGER notify_change_trg "
+            f"AFTER INSERT OR UPDATE OR DELETE ON {self.table_name()} "
+            f"FOR EACH ROW EXECUTE FUNCTION {func}"
+            f"('{self.dbconn.CHANGE_CHANNEL}', '{name}')",
+        ]
+        cur = self.dbconn.conn.cursor()
+        try:
+            for sql in sql_list:
+                cur.execute(sql)
+            self.dbconn.conn.commit()
+        except Exception as e:
+            self.dbconn.conn.rollback()
+            print(f"Ошибка установки оповещений: {e}")
+
+    @retrying([])
+    def partitions(self):
+        """Получение списка секций таблицы с их границами."""
+        sql = (
+            "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) "
+            "FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = %s::regclass ORDER BY c.relname"
+        )
+        cur = self.dbconn.conn.cursor()
+        try:
+            cur.execute(sql, (self.table_name(),))
+            return cur.fetchall()
+        except Exception as e:
+            if self.dbconn.is_transient(e):
+                raise
+            self.dbconn.conn.rollback()
+            print(f"Ошибка получения секций: {e}")
+            return []
+
+    def attach_partition(self, suffix, values):
+        """Подключение секции к таблице.
+
+        Если таблицы секции нет, она создается по образцу основной.
+        Границы задаются так же, как в partition_bound().
+        """
+        name = self.partition_name(suffix)
+        sql_list = [
+            (
+                f"CREATE TABLE IF NOT EXISTS {name} "
+                f"(LIKE {self.table_name()} INCLUDING DEFAULTS "
+                "INCLUDING CONSTRAINTS)",
+                None,
+            ),
+            (
+                f"ALTER TABLE {self.table_name()} ATTACH PARTITION {name} "
+                f"{self.partition_bound(values)}",
+                values if isinstance(values, list) else None,
+            ),
+        ]
+        cur = self.dbconn.conn.cursor()
+        try:
+            for sql, params in sql_list:
+                cur.execute(sql, params)
+            self.dbconn.conn.commit()
+            return True
+        except Exception as e:
+            self.dbconn.conn.rollback()
+            print(f"Ошибка подключения секции: {e}")
+            return False
 
+    def detach_partition(self, suffix, drop=False):
+        """Отключение секции от таблицы (drop=True - с удалением)."""
+        name = self.partition_name(suffix)
+        sql_list = [
+            f"ALTER TABLE {self.table_name()} DETACH PARTITION {name}"
+        ]
+        if drop:
+            sql_list.append(f"DROP TABLE {name}")
+        cur = self.dbconn.conn.cursor()
+        try:
+            for sql in sql_list:
+                cur.execute(sql)
+            self.dbconn.conn.commit()
+            return True
+        except Exception as e:
+            self.dbconn.conn.rollback()
+            print(f"Ошибка отключения секции: {e}")
+            return False
+
+    def _run_restore_step(self, sql, failures):
+        """Выполнение одного шага восстановления в своей транзакции.
+
+        Ошибка добавляется в список failures.
+        """
+        cur = self.dbconn.conn.cursor()
+        try:
+            cur.execute(sql)
+            self.dbconn.conn.commit()
+            return True
+        except Exception as e:
+            self.dbconn.conn.rollback()
+            print(f"Ошибка восстановления после загрузки: {e}")
+            failures.append((sql, str(e).strip()))
+            return False
+
+    @contextmanager
+    def bulk_load_mode(self, drop_indexes=False, defer_constraints=False):
+        """Режим массовой загрузки данных в таблицу.
+
+        На время загрузки в сессии отключается synchronous_commit.
+        drop_indexes=True удаляет индексы из indexes() и строит их
+        заново после загрузки. defer_constraints=True снимает внешние
+        ключи и CHECK-ограничения, а после загрузки добавляет их как
+        NOT VALID и проверяет одним VALIDATE CONSTRAINT. Для
+        секционированных таблиц внешний ключ NOT VALID не
+        поддерживается, поэтому он добавляется с проверкой за один
+        проход. Все настройки восстанавливаются и при ошибке.
+
+        Восстановление выполняет все шаги, после чего при неудачных
+        шагах (например, загруженные строки нарушают ограничение)
+        выбрасывается BulkLoadRestoreError. Индексы и ограничения
+        снимаются до начала загрузки отдельной транзакцией, поэтому
+        другие сессии в это время могут записывать строки без
+        проверок: режим рассчитан на загрузку без параллельных
+        пишущих пользователей.
+        """
+        conn = self.dbconn.conn
+        cur = conn.cursor()
+        cur.execute("SHOW synchronous_commit")
+        sync_commit = cur.fetchone()[0]
+        cur.execute(
+            "SELECT relkind = 'p' FROM pg_class WHERE oid = %s::regclass",
+            (self.table_name(),),
+        )
+        partitioned = cur.fetchone()[0]
+        constraints = []
+        if defer_constraints:
+            cur.execute(
+                "SELECT conname, pg_get_constraintdef(oid), contype "
+                "FROM pg_constraint "
+                "WHERE conrelid = %s::regclass AND contype IN ('f', 'c') "
+                "AND NOT coninhcount > 0 ORDER BY conname",
+                (self.table_name(),),
+            )
+            constraints = cur.fetchall()
+        indexes = self.indexes() if drop_indexes else {}
+        conn.commit()
+        prepared = False
+        try:
+            cur.execute("SET synchronous_commit = off")
+            for name in indexes:
+                cur.execute(f"DROP INDEX IF EXISTS {self.dbconn.prefix}{name}")
+            for name, _, _ in constraints:
+                cur.execute(
+                    f"ALTER TABLE {self.table_name()} DROP CONSTRAINT {name}"
+                )
+            conn.commit()
+            prepared = True
+            yield self
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            failures = []
+            if prepared:
+                for name, definition, contype in constraints:
+                    not_valid = not (contype == "f" and partitioned)
+                    added = self._run_restore_step(
+                        f"ALTER TABLE {self.table_name()} "
+                        f"ADD CONSTRAINT {name} {definition}"
+                        + (" NOT VALID" if not_valid else ""),
+                        failures,
+                    )
+                    if added and not_valid:
+                        self._run_restore_step(
+                            f"ALTER TABLE {self.table_name()} "
+                            f"VALIDATE CONSTRAINT {name}",
+                            failures,
+                        )
+                for name, cols in indexes.items():
+                    self._run_restore_step(
+                        self.index_sql(name, cols), failures
+                    )
+            self._run_restore_step(
+                f"SET synchronous_commit = '{sync_commit}'", failures
+            )
+            if failures:
+                raise BulkLoadRestoreError(failures)
+
+    @retrying(False)
+    def exists(self):
+        """Проверка существования таблицы в БД."""
+        cur = self.dbconn.conn.cursor()
+        cur.execute("SELECT to_regclass(%s)", (self.table_name(),))
+        return cur.fetchone()[0] is not None
+
+    @retrying()
     def drop(self):
         """Удаление таблицы из базы данных."""
         sql = f"DROP TABLE IF EXISTS {self.table_name()} CASCADE"
@@ -62,9 +608,12 @@ class DbTable:
             cur.execute(sql)
             self.dbconn.conn.commit()
         except Exception as e:
+            if self.dbconn.is_transient(e):
+                raise
             self.dbconn.conn.rollback()
             print(f"Ошибка удаления таблицы: {e}")
 
+    @retrying(False, idempotent=False)
     def insert_one(self, vals):
         """Вставка одной записи в таблицу."""
         cols = self.column_names_without_id()
@@ -79,25 +628,129 @@ class DbTable:
             self.dbconn.conn.commit()
             return True
         except Exception as e:
+            if self.dbconn.is_transient(e):
+                raise
             self.dbconn.conn.rollback()
             print(f"Ошибка вставки данных: {e}")
             return False
 
-    def update_by_id(self, id_val, vals):
-        """Обновление записи по ID."""
+    @retrying(False, idempotent=False)
+    def update_by_id(self, id_val, vals, expected_version=None):
+        """Обновление записи по ID.
+
+        Если задан expected_version, запись обновляется только при
+        совпадении версии (оптимистическая блокировка), иначе
+        возвращается UpdateConflict с текущим состоянием записи.
+        Для версионируемой таблицы успешное обновление возвращает
+        UpdateResult с новой версией, для остальных - True.
+        expected_version для таблицы без колонки версии вызывает
+        ValueError: проверить версию невозможно.
+        """
+        version = self.version_column()
+        if expected_version is not None and not version:
+            raise ValueError(
+                f"Таблица {self.table_name()} не версионируется"
+            )
         cols = self.column_names_without_id()
         set_clause = ", ".join([f"{col} = %s" for col in cols])
+        if version:
+            set_clause += f", {version} = {version} + 1"
         sql = f"UPDATE {self.table_name()} SET {set_clause} WHERE id = %s"
+        params = list(vals) + [id_val]
+        if expected_version is not None:
+            sql += f" AND {version} = %s"
+            params.append(expected_version)
+        if version:
+            sql += f" RETURNING {version}"
         cur = self.dbconn.conn.cursor()
         try:
-            cur.execute(sql, list(vals) + [id_val])
+            cur.execute(sql, params)
+            row = cur.fetchone() if version else None
             self.dbconn.conn.commit()
+            if expected_version is not None and cur.rowcount == 0:
+                return UpdateConflict(self.find_by_id(id_val))
+            if row is not None:
+                return UpdateResult(row[0])
             return True
         except Exception as e:
+            if self.dbconn.is_transient(e):
+                raise
             self.dbconn.conn.rollback()
             print(f"Ошибка обновления данных: {e}")
             return False
 
+    def column_type(self, col):
+        """Получение типа колонки для приведения значений в запросах."""
+        col_type = self.columns()[col][0]
+        return {"SERIAL": "INT", "BIGSERIAL": "BIGINT"}.get(col_type, col_type)
+
+    @retrying([], idempotent=False)
+    def update_many(self, items, columns=None, page_size=1000):
+        """Массовое обновление записей одним запросом на страницу.
+
+        items - список пар (id, vals), vals - значения колонок columns
+        (по умолчанию column_names_without_id()). Используется
+        UPDATE ... FROM (VALUES ...); все страницы выполняются в одной
+        транзакции. Возвращает список ID обновленных записей.
+        """
+        cols = columns or self.column_names_without_id()
+        if not items:
+            return []
+        set_clause = ", ".join([f"{col} = v.{col}" for col in cols])
+        version = self.version_column()
+        if version:
+            set_clause += f", {version} = t.{version} + 1"
+        sql = (
+            f"UPDATE {self.table_name()} t SET {set_clause} "
+            f"FROM (VALUES %s) AS v (id, {', '.join(cols)}) "
+            "WHERE t.id = v.id RETURNING t.id"
+        )
+        template = "(" + ", ".join(
+            f"%s::{self.column_type(col)}" for col in ["id"] + cols
+        ) + ")"
+        cur = self.dbconn.conn.cursor()
+        try:
+            res = psycopg2.extras.execute_values(
+                cur,
+                sql,
+                [[id_val] + list(vals) for id_val, vals in items],
+                template=template,
+                page_size=page_size,
+                fetch=True,
+            )
+            self.dbconn.conn.commit()
+            return [row[0] for row in res]
+        except Exception as e:
+            if self.dbconn.is_transient(e):
+                raise
+            self.dbconn.conn.rollback()
+            print(f"Ошибка обновления данных: {e}")
+            return []
+
+    @retrying([], idempotent=False)
+    def delete_many(self, ids):
+        """Удаление записей по списку ID одним запросом.
+
+        Возвращает список ID удаленных записей.
+        """
+        sql = (
+            f"DELETE FROM {self.table_name()} "
+            "WHERE id = ANY(%s) RETURNING id"
+        )
+        cur = self.dbconn.conn.cursor()
+        try:
+            cur.execute(sql, (list(ids),))
+            res = [row[0] for row in cur.fetchall()]
+            self.dbconn.conn.commit()
+            return res
+        except Exception as e:
+            if self.dbconn.is_transient(e):
+                raise
+            self.dbconn.conn.rollback()
+            print(f"Ошибка удаления данных: {e}")
+            return []
+
+    @retrying(False, idempotent=False)
     def delete_by_id(self, id_val):
         """Удаление записи по ID."""
         sql = f"DELETE FROM {self.table_name()} WHERE id = %s"
@@ -107,14 +760,18 @@ class DbTable:
             self.dbconn.conn.commit()
             return True
         except Exception as e:
+            if self.dbconn.is_transient(e):
+                raise
             self.dbconn.conn.rollback()
             print(f"Ошибка удаления данных: {e}")
             return False
 
+    @retrying([])
     def all(self, limit=None, offset=None):
         """Получение всех записей с поддержкой пагинации."""
         sql = (
-            f"SELECT * FROM {self.table_name()} "
+            f"SELECT {self.select_list()} "
+            f"FROM {self.table_name()} "
             f"ORDER BY {', '.join(self.primary_key())}"
         )
         params = []
@@ -125,14 +782,176 @@ class DbTable:
                 sql += " OFFSET %s"
                 params.append(offset)
         
-        cur = self.dbconn.conn.cursor()
+        cur = self.cursor()
         try:
             cur.execute(sql, params) if params else cur.execute(sql)
             return cur.fetchall()
         except Exception as e:
+            if self.dbconn.is_transient(e):
+                raise
+            self.dbconn.conn.rollback()
             print(f"Ошибка получения данных: {e}")
             return []
 
+    def export(
+        self,
+        path_or_stream,
+        format="csv",
+        where=None,
+        params=None,
+        compress=None,
+    ):
+        """Потоковая выгрузка таблицы через COPY (SELECT ...) TO STDOUT.
+
+        path_or_stream - путь к файлу или двоичный поток с методом
+        write. format - "csv" (с заголовком) или "binary". where -
+        необязательное условие с параметрами params. compress - "gzip"
+        или None. Данные пишутся блоками по EXPORT_CHUNK байт без
+        создания строк-объектов Python. Возвращает количество
+        выгруженных строк или None при ошибке.
+        """
+        if format not in ("csv", "binary") or compress not in ("gzip", None):
+            print("Неподдерживаемый формат выгрузки!")
+            return None
+        sql = f"SELECT {self.select_list()} FROM {self.table_name()}"
+        if where:
+            sql += f" WHERE {where}"
+        options = "FORMAT csv, HEADER" if format == "csv" else "FORMAT binary"
+        copy_sql = f"COPY ({sql}) TO STDOUT WITH ({options})"
+        cur = self.dbconn.conn.cursor()
+        raw = None
+        zipped = None
+        try:
+            if isinstance(path_or_stream, (str, os.PathLike)):
+                raw = open(path_or_stream, "wb")
+                sink = raw
+            else:
+                sink = path_or_stream
+            if compress:
+                zipped = gzip.GzipFile(fileobj=sink, mode="wb")
+                sink = zipped
+            writer = ChunkWriter(sink, self.EXPORT_CHUNK)
+            cur.copy_expert(cur.mogrify(copy_sql, params).decode(), writer)
+            writer.flush()
+            self.dbconn.conn.commit()
+            return cur.rowcount
+        except Exception as e:
+            self.dbconn.conn.rollback()
+            print(f"Ошибка выгрузки данных: {e}")
+            return None
+        finally:
+            if zipped is not None:
+                zipped.close()
+            if raw is not None:
+                raw.close()
+
+    def snapshot_kinds(self):
+        """Виды колонок снимка: "i" - целые, "c" - NUMERIC, "s" - строки."""
+        res = []
+        for col in self.column_names():
+            col_type = self.columns()[col][0].upper()
+            if col_type.startswith("NUMERIC"):
+                res.append((col, "c"))
+            elif col_type in ("INT", "INTEGER", "BIGINT", "SMALLINT",
+                              "SERIAL", "BIGSERIAL"):
+                res.append((col, "i"))
+            else:
+                res.append((col, "s"))
+        return res
+
+    def change_marker(self, where=None, params=None):
+        """Метка изменения данных: количество, max(id) и сумма версий.
+
+        Любая вставка, удаление или обновление версионируемой строки
+        меняет метку (версию увеличивает триггер, см.
+        install_version_trigger). Возвращает None, если БД недоступна.
+        Запрос выполняется одной попыткой без повторов, чтобы
+        warm_start не ждал недоступную БД.
+        """
+        version = self.version_column()
+        sql = (
+            "SELECT COUNT(*), COALESCE(MAX(id), 0), "
+            f"{f'COALESCE(SUM({version}), 0)' if version else '0'} "
+            f"FROM {self.table_name()}"
+        )
+        if where:
+            sql += f" WHERE {where}"
+        try:
+            cur = self.dbconn.conn.cursor()
+            cur.execute(sql, params)
+            return [int(x) for x in cur.fetchone()]
+        except Exception as e:
+            self.dbconn.rollback()
+            print(f"Ошибка получения метки изменений: {e}")
+            return None
+
+    def _snapshot_filter(self, where, params):
+        """Описание фильтра снимка в виде, сохраняемом в JSON."""
+        return json.loads(json.dumps([where, params]))
+
+    @retrying()
+    def dump_snapshot(self, path, where=None, params=None):
+        """Сохранение строк таблицы в двоичный снимок.
+
+        Возвращает открытый Snapshot или None при ошибке.
+        """
+        marker = self.change_marker(where, params)
+        if marker is None:
+            return None
+        sql = f"SELECT {self.select_list()} FROM {self.table_name()}"
+        if where:
+            sql += f" WHERE {where}"
+        sql += f" ORDER BY {', '.join(self.primary_key())}"
+        cur = self.dbconn.conn.cursor()
+        try:
+            cur.execute(sql, params)
+            rows = cur.fetchall()
+            Snapshot.write(
+                path,
+                marker,
+                self._snapshot_filter(where, params),
+                self.snapshot_kinds(),
+                rows,
+            )
+        except Exception as e:
+            if self.dbconn.is_transient(e):
+                raise
+            self.dbconn.conn.rollback()
+            print(f"Ошибка сохранения снимка: {e}")
+            return None
+        return Snapshot(path, self.row_class())
+
+    def load_snapshot(self, path, where=None, params=None):
+        """Открытие снимка, если он соответствует данным в БД.
+
+        Возвращает None, если снимка нет, он сделан с другим фильтром
+        или метка изменений в БД отличается. Если БД недоступна,
+        снимок возвращается без проверки.
+        """
+        if not os.path.exists(path):
+            return None
+        try:
+            snap = Snapshot(path, self.row_class())
+        except Exception as e:
+            print(f"Ошибка чтения снимка: {e}")
+            return None
+        if snap.filter != self._snapshot_filter(where, params):
+            snap.close()
+            return None
+        marker = self.change_marker(where, params)
+        if marker is not None and marker != snap.marker:
+            snap.close()
+            return None
+        return snap
+
+    def warm_start(self, path, where=None, params=None):
+        """Загрузка строк из снимка или из БД с обновлением снимка."""
+        snap = self.load_snapshot(path, where, params)
+        if snap is None:
+            snap = self.dump_snapshot(path, where, params)
+        return snap
+
+    @retrying(0)
     def count(self):
         """Подсчет общего количества записей."""
         sql = f"SELECT COUNT(*) FROM {self.table_name()}"
@@ -141,17 +960,40 @@ class DbTable:
         result = cur.fetchone()
         return result[0] if result else 0
 
+    @retrying()
+    def find_by_id(self, id_val):
+        """Получение записи по ID."""
+        sql = (
+            f"SELECT {self.select_list()} FROM {self.table_name()} "
+            "WHERE id = %s"
+        )
+        cur = self.cursor()
+        try:
+            cur.execute(sql, (id_val,))
+            return cur.fetchone()
+        except Exception as e:
+            if self.dbconn.is_transient(e):
+                raise
+            self.dbconn.conn.rollback()
+            print(f"Ошибка получения записи: {e}")
+            return None
+
+    @retrying()
     def find_by_position(self, num):
         """Получение записи по позиции."""
         sql = (
-            f"SELECT * FROM {self.table_name()} "
+            f"SELECT {self.select_list()} "
+            f"FROM {self.table_name()} "
             f"ORDER BY {', '.join(self.primary_key())} "
             "LIMIT 1 OFFSET %s"
         )
-        cur = self.dbconn.conn.cursor()
+        cur = self.cursor()
         try:
             cur.execute(sql, (num - 1,))
             return cur.fetchone()
         except Exception as e:
+            if self.dbconn.is_transient(e):
+                raise
+            self.dbconn.conn.rollback()
             print(f"Ошибка получения записи: {e}")
             return None
@@ -0,0 +1,235 @@
+"""Модуль для работы с агрегатом количества экскурсий по маршрутам."""
+from dbtable import DbTable, retrying
+from tour_table import TourTable
+
+
+class ExcursionCountTable(DbTable):
+    """Класс сводной таблицы количества экскурсий по маршрутам.
+
+    Сводные таблицы поддерживаются триггерами на таблицах RouteCity
+    и Excursion, поэтому поиск туров с наибольшим числом экскурсий
+    выполняется по индексу без соединения четырех таблиц.
+    """
+
+    def table_name(self):
+        """Получение имени сводной таблицы по маршрутам."""
+        return self.dbconn.prefix + "route_excursion_count"
+
+    def city_table_name(self):
+        """Получение имени сводной таблицы по городам."""
+        return self.dbconn.prefix + "city_excursion_count"
+
+    def columns(self):
+        """Структура сводной таблицы по маршрутам."""
+        return {
+            "route_id": ["INT", "PRIMARY KEY"],
+            "excursion_count": ["INT", "NOT NULL", "DEFAULT 0"],
+        }
+
+    def primary_key(self):
+        """Получение списка колонок первичного ключа."""
+        return ["route_id"]
+
+    def create(self, notify=False):
+        """Создание сводных таблиц, индексов и триггеров.
+
+        Триггер на RouteCity перед чтением количества экскурсий города
+        блокирует его строку (city_excursion_count_lock), поэтому
+        одновременные вставки экскурсии и связи маршрута с тем же
+        городом не теряют изменение. Строка удаленного маршрута
+        удаляется из сводной таблицы триггерами на RouteCity и Route.
+        Триггеры удаляются вместе с таблицами RouteCity и Route,
+        поэтому после их пересоздания create() нужно вызвать снова.
+        """
+        super().create(notify)
+        p = self.dbconn.prefix
+        sql_list = [
+            f"CREATE TABLE IF NOT EXISTS {self.city_table_name()} ("
+            "city_id INT PRIMARY KEY, "
+            "excursion_count INT NOT NULL DEFAULT 0)",
+            "CREATE INDEX IF NOT EXISTS route_excursion_count_count_idx "
+            f"ON {self.table_name()} (excursion_count DESC)",
+            f"CREATE OR REPLACE FUNCTION {p}route_excursion_count_shift("
+            "r_id INT, delta INT) RETURNS void AS $$ "
+            f"INSERT INTO {self.table_name()} AS rec "
+            "(route_id, excursion_count) VALUES (r_id, delta) "
+            "ON CONFLICT (route_id) DO UPDATE "
+            "SET excursion_count = rec.excursion_count "
+            "+ EXCLUDED.excursion_count "
+            "$$ LANGUAGE sql",
+            f"CREATE OR REPLACE FUNCTION {p}city_excursion_count_shift("
+            "c_id INT, delta INT) RETURNS void AS $$ "
+            f"INSERT INTO {self.city_table_name()} AS cec "
+            "(city_id, excursion_count) VALUES (c_id, delta) "
+            "ON CONFLICT (city_id) DO UPDATE "
+            "SET excursion_count = cec.excursion_count "
+            "+ EXCLUDED.excursion_count; "
+            f"UPDATE {self.table_name()} rec "
+            "SET excursion_count = rec.excursion_count + delta "
+            f"FROM {p}routecity rc "
+            "WHERE rc.route_id = rec.route_id AND rc.city_id = c_id "
+            "$$ LANGUAGE sql",
+            f"CREATE OR REPLACE FUNCTION {p}city_excursion_count_lock("
+            "c_id INT) RETURNS INT AS $$ "
+            f"INSERT INTO {self.city_table_name()} AS cec "
+            "(city_id, excursion_count) VALUES (c_id, 0) "
+            "ON CONFLICT (city_id) DO UPDATE "
+            "SET excursion_count = cec.excursion_count "
+            "RETURNING cec.excursion_count "
+            "$$ LANGUAGE sql",
+            f"CREATE OR REPLACE FUNCTION {p}excursion_count_on_excursion() "
+            "RETURNS trigger AS $$ BEGIN "
+            "IF TG_OP IN ('UPDATE', 'DELETE') THEN "
+            f"PERFORM {p}city_excursion_count_shift(OLD.city_id, -1); "
+            "END IF; "
+            "IF TG_OP IN ('INSERT', 'UPDATE') THEN "
+            f"PERFORM {p}city_excursion_count_shift(NEW.city_id, 1); "
+            "END IF; "
+            "RETURN NULL; END $$ LANGUAGE plpgsql",
+            f"CREATE OR REPLACE FUNCTION {p}excursion_count_on_route_city() "
+            "RETURNS trigger AS $$ BEGIN "
+            "IF TG_OP IN ('UPDATE', 'DELETE') THEN "
+            f"PERFORM {p}route_excursion_count_shift(OLD.route_id, "
+            f"-{p}city_excursion_count_lock(OLD.city_id)); "
+            f"DELETE FROM {self.table_name()} "
+            "WHERE route_id = OLD.route_id AND NOT EXISTS ("
+            f"SELECT 1 FROM {p}route WHERE id = OLD.route_id); "
+            "END IF; "
+            "IF TG_OP IN ('INSERT', 'UPDATE') THEN "
+            f"PERFORM {p}route_excursion_count_shift(NEW.route_id, "
+            f"{p}city_excursion_count_lock(NEW.city_id)); "
+            "END IF; "
+            "RETURN NULL; END $$ LANGUAGE plpgsql",
+            f"CREATE OR REPLACE FUNCTION {p}excursion_count_on_route() "
+            "RETURNS trigger AS $$ BEGIN "
+            f"DELETE FROM {self.table_name()} WHERE route_id = OLD.id; "
+            "RETURN NULL; END $$ LANGUAGE plpgsql",
+            f"DROP TRIGGER IF EXISTS excursion_count_trg ON {p}excursion",
+            "CREATE TRIGGER excursion_count_trg "
+            "AFTER INSERT OR DELETE OR UPDATE OF city_id "
+            f"ON {p}excursion FOR EACH ROW "
+            f"EXECUTE FUNCTION {p}excursion_count_on_excursion()",
+            f"DROP TRIGGER IF EXISTS excursion_count_trg ON {p}routecity",
+            "CREATE TRIGGER excursion_count_trg "
+            "AFTER INSERT OR DELETE OR UPDATE OF route_id, city_id "
+            f"ON {p}routecity FOR EACH ROW "
+            f"EXECUTE FUNCTION {p}excursion_count_on_route_city()",
+            f"DROP TRIGGER IF EXISTS excursion_count_trg ON {p}route",
+            "CREATE TRIGGER excursion_count_trg AFTER DELETE "
+            f"ON {p}route FOR EACH ROW "
+            f"EXECUTE FUNCTION {p}excursion_count_on_route()",
+        ]
+        cur = self.dbconn.conn.cursor()
+        try:
+            for sql in sql_list:
+                cur.execute(sql)
+            self.dbconn.conn.commit()
+        except Exception as e:
+            self.dbconn.conn.rollback()
+            print(f"Ошибка создания триггеров агрегата: {e}")
+            return
+        self.refresh()
+
+    def drop(self):
+        """Удаление сводных таблиц, функций и триггеров."""
+        p = self.dbconn.prefix
+        sql_list = [
+            f"DROP FUNCTION IF EXISTS {p}excursion_count_on_excursion() "
+            "CASCADE",
+            f"DROP FUNCTION IF EXISTS {p}excursion_count_on_route_city() "
+            "CASCADE",
+            f"DROP FUNCTION IF EXISTS {p}excursion_count_on_route() CASCADE",
+            f"DROP FUNCTION IF EXISTS {p}city_excursion_count_shift(INT, INT)",
+            f"DROP FUNCTION IF EXISTS {p}city_excursion_count_lock(INT)",
+            f"DROP FUNCTION IF EXISTS {p}route_excursion_count_shift(INT, INT)",
+            f"DROP TABLE IF EXISTS {self.city_table_name()} CASCADE",
+        ]
+        cur = self.dbconn.conn.cursor()
+        try:
+            for sql in sql_list:
+                cur.execute(sql)
+            self.dbconn.conn.commit()
+        except Exception as e:
+            self.dbconn.conn.rollback()
+            print(f"Ошибка удаления агрегата: {e}")
+        super().drop()
+
+    @retrying(False)
+    def refresh(self):
+        """Полный пересчет сводных таблиц по исходным данным."""
+        p = self.dbconn.prefix
+        sql_list = [
+            f"TRUNCATE {self.table_name()}, {self.city_table_name()}",
+            f"INSERT INTO {self.city_table_name()} "
+            "(city_id, excursion_count) "
+            f"SELECT city_id, COUNT(*) FROM {p}excursion GROUP BY city_id",
+            f"INSERT INTO {self.table_name()} (route_id, excursion_count) "
+            "SELECT rc.route_id, COALESCE(SUM(cec.excursion_count), 0) "
+            f"FROM {p}routecity rc "
+            f"LEFT JOIN {self.city_table_name()} cec "
+            "ON cec.city_id = rc.city_id "
+            "GROUP BY rc.route_id",
+        ]
+        cur = self.dbconn.conn.cursor()
+        try:
+            for sql in sql_list:
+                cur.execute(sql)
+            self.dbconn.conn.commit()
+            return True
+        except Exception as e:
+            if self.dbconn.is_transient(e):
+                raise
+            self.dbconn.conn.rollback()
+            print(f"Ошибка пересчета агрегата: {e}")
+            return False
+
+    @retrying(0)
+    def count_by_route_id(self, route_id):
+        """Количество возможных экскурсий на маршруте."""
+        sql = (
+            f"SELECT excursion_count FROM {self.table_name()} "
+            "WHERE route_id = %s"
+        )
+        cur = self.dbconn.conn.cursor()
+        cur.execute(sql, (route_id,))
+        result = cur.fetchone()
+        return result[0] if result else 0
+
+    @retrying(0)
+    def count_by_city_id(self, city_id):
+        """Количество экскурсий в городе."""
+        sql = (
+            f"SELECT excursion_count FROM {self.city_table_name()} "
+            "WHERE city_id = %s"
+        )
+        cur = self.dbconn.conn.cursor()
+        cur.execute(sql, (city_id,))
+        result = cur.fetchone()
+        return result[0] if result else 0
+
+    @retrying([])
+    def top_tours(self, limit=1):
+        """Получение туров с наибольшим числом возможных экскурсий.
+
+        Строки - объекты TourTable.row_class() с дополнительным
+        полем excursion_count.
+        """
+        tours = TourTable()
+        tours.dbconn = self.dbconn
+        sql = (
+            f"SELECT {tours.select_list('t')}, rec.excursion_count "
+            f"FROM {self.table_name()} rec "
+            f"JOIN {tours.table_name()} t ON t.route_id = rec.route_id "
+            "ORDER BY rec.excursion_count DESC, t.id "
+            "LIMIT %s"
+        )
+        cur = tours.cursor(extra=("excursion_count",))
+        try:
+            cur.execute(sql, (limit,))
+            return cur.fetchall()
+        except Exception as e:
+            if self.dbconn.is_transient(e):
+                raise
+            self.dbconn.conn.rollback()
+            print(f"Ошибка получения туров: {e}")
+            return []
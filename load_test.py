@@ -0,0 +1,266 @@
+"""Нагрузочное тестирование приложения сценариями операторов.
+
+Каждый моделируемый пользователь работает в отдельном процессе
+со своим соединением с БД и проходит меню Main, отвечая на запросы
+ввода случайными, но допустимыми действиями. По итогам выводится
+пропускная способность, перцентили задержек по действиям меню
+и количество ошибок, взаимоблокировок и конфликтов версий.
+
+Запуск: python load_test.py --users 8 --actions 100 --reset
+"""
+import argparse
+import builtins
+import math
+import multiprocessing
+import random
+import sys
+import time
+
+MENU_ACTIONS = {
+    "main": [("1", "list_cities", 1)],
+    "cities": [
+        ("]", "page_cities", 4),
+        ("[", "page_cities", 2),
+        ("3", "add_city", 1),
+        ("4", "edit_city", 2),
+        ("5", "delete_city", 1),
+        ("6", "open_routes", 3),
+    ],
+    "routes": [
+        ("]", "page_routes", 3),
+        ("[", "page_routes", 1),
+        ("7", "add_route", 2),
+        ("8", "edit_route", 2),
+        ("9", "delete_route", 1),
+        ("1", "list_cities", 1),
+    ],
+}
+EXIT_STEPS = {"main": "9", "cities": "0", "routes": "0"}
+
+
+class SessionOutput:
+    """Поток вывода сессии: отслеживает текущее меню и ошибки."""
+
+    def __init__(self):
+        """Инициализация счетчиков."""
+        self.menu = "main"
+        self.errors = 0
+        self.deadlocks = 0
+        self.conflicts = 0
+
+    def write(self, text):
+        """Разбор выводимого приложением текста."""
+        if "Основное меню" in text:
+            self.menu = "main"
+        elif "СПИСОК ГОРОДОВ" in text:
+            self.menu = "cities"
+        elif "МАРШРУТЫ ИЗ ГОРОДА" in text:
+            self.menu = "routes"
+        if "Ошибка" in text:
+            self.errors += 1
+        if "deadlock detected" in text:
+            self.deadlocks += 1
+        if "другим пользователем" in text:
+            self.conflicts += 1
+        return len(text)
+
+    def flush(self):
+        """Вывод не буферизуется."""
+
+
+class SimulatedUser:
+    """Моделируемый оператор, отвечающий на запросы меню Main."""
+
+    def __init__(self, user_id, actions, seed):
+        """Инициализация сценария пользователя."""
+        self.user_id = user_id
+        self.actions_left = actions
+        self.rng = random.Random(seed)
+        self.output = SessionOutput()
+        self.latencies = []
+        self.action = None
+        self.started = None
+        self.seq = 0
+
+    def finish_action(self):
+        """Завершение замера задержки предыдущего действия меню."""
+        if self.action is not None:
+            self.latencies.append(
+                (self.action, time.perf_counter() - self.started)
+            )
+            self.action = None
+
+    def read_next_step(self):
+        """Выбор следующего действия в текущем меню."""
+        self.finish_action()
+        menu = self.output.menu
+        if self.actions_left <= 0:
+            return EXIT_STEPS[menu]
+        choices = MENU_ACTIONS[menu]
+        step, action, _ = self.rng.choices(
+            choices, weights=[w for _, _, w in choices]
+        )[0]
+        self.actions_left -= 1
+        self.action = action
+        self.started = time.perf_counter()
+        return step
+
+    def input(self, prompt=""):
+        """Ответ на запрос ввода внутри диалога."""
+        self.seq += 1
+        if "номер" in prompt:
+            return str(self.rng.randint(1, 10))
+        if "цен" in prompt:
+            return str(self.rng.randint(1000, 50000))
+        if "описание" in prompt:
+            return f"Описание {self.user_id}-{self.seq}"
+        if "Подтвердите" in prompt:
+            return "да"
+        if "Вы уверены" in prompt:
+            return "нет"
+        if "без изменений" in prompt and self.rng.random() < 0.3:
+            return ""
+        return f"Тест {self.user_id}-{self.seq}-{self.rng.randint(0, 10**6)}"
+
+
+def run_user(user_id, actions, seed):
+    """Прогон сессии одного пользователя в отдельном процессе."""
+    user = SimulatedUser(user_id, actions, seed)
+    builtins.input = user.input
+    sys.stdout = user.output
+    aborted = 0
+    started = time.time()
+    stats = {}
+    try:
+        import main
+
+        stats = main.Main.connection.stats
+        m = main.Main()
+        m.read_next_step = user.read_next_step
+        m.main_cycle()
+    except Exception:
+        aborted = 1
+    user.finish_action()
+    return {
+        "latencies": user.latencies,
+        "errors": user.output.errors,
+        "deadlocks": user.output.deadlocks,
+        "conflicts": user.output.conflicts,
+        "aborted": aborted,
+        "db_stats": dict(stats),
+        "started": started,
+        "finished": time.time(),
+    }
+
+
+def percentile(values, p):
+    """Перцентиль по методу ближайшего ранга."""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def prepare_database(cities, routes):
+    """Сброс таблиц и заполнение тестовыми данными."""
+    import main
+
+    m = main.Main()
+    m.db_drop()
+    m.db_init()
+    m.db_insert_sample_data()
+    cur = m.connection.conn.cursor()
+    prefix = m.connection.prefix
+    cur.execute(
+        f"INSERT INTO {prefix}city (name) "
+        "SELECT 'Город ' || g FROM generate_series(1, %s) g",
+        (cities,),
+    )
+    cur.execute(
+        f"INSERT INTO {prefix}route "
+        "(name, departure_city_id, description, base_price) "
+        "SELECT 'Маршрут ' || g, c.id, NULL, 1000 + g %% 50000 "
+        "FROM generate_series(1, %s) g "
+        f"JOIN {prefix}city c ON c.id = 1 + g %% %s",
+        (routes, cities + 4),
+    )
+    m.connection.conn.commit()
+
+
+def print_report(results):
+    """Вывод итогового отчета нагрузочного теста."""
+    elapsed = max(r["finished"] for r in results) - min(
+        r["started"] for r in results
+    )
+    by_action = {}
+    for res in results:
+        for action, latency in res["latencies"]:
+            by_action.setdefault(action, []).append(latency * 1000)
+    total = sum(len(v) for v in by_action.values())
+
+    print("=" * 72)
+    print(f"Пользователей: {len(results)} | Действий: {total} | "
+          f"Время: {elapsed:.2f} с | "
+          f"Пропускная способность: {total / elapsed:.1f} действий/с")
+    print("-" * 72)
+    print(f"{'Действие':<14} | {'Кол-во':>7} | {'p50, мс':>8} | "
+          f"{'p95, мс':>8} | {'p99, мс':>8} | {'max, мс':>8}")
+    print("-" * 72)
+    for action, values in sorted(by_action.items()):
+        print(
+            f"{action:<14} | {len(values):>7} | "
+            f"{percentile(values, 50):>8.1f} | "
+            f"{percentile(values, 95):>8.1f} | "
+            f"{percentile(values, 99):>8.1f} | {max(values):>8.1f}"
+        )
+    print("-" * 72)
+    print(
+        f"Ошибки БД: {sum(r['errors'] for r in results)} | "
+        f"Взаимоблокировки: {sum(r['deadlocks'] for r in results)} | "
+        f"Конфликты версий: {sum(r['conflicts'] for r in results)} | "
+        f"Прерванные сессии: {sum(r['aborted'] for r in results)}"
+    )
+    stats = {}
+    for res in results:
+        for key, value in res["db_stats"].items():
+            stats[key] = stats.get(key, 0) + value
+    print(
+        f"Переподключения: {stats.get('reconnects', 0)} | "
+        f"Повторы чтения: {stats.get('read_retries', 0)} | "
+        f"Повторы транзакций: {stats.get('transaction_retries', 0)} | "
+        f"Отказы после повторов: {stats.get('failures', 0)}"
+    )
+    print("=" * 72)
+
+
+def main_load_test():
+    """Разбор аргументов и запуск нагрузочного теста."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=4)
+    parser.add_argument("--actions", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--reset", action="store_true",
+                        help="пересоздать таблицы перед тестом")
+    parser.add_argument("--cities", type=int, default=100,
+                        help="дополнительные города при --reset")
+    parser.add_argument("--routes", type=int, default=10000,
+                        help="дополнительные маршруты при --reset")
+    args = parser.parse_args()
+
+    if args.reset:
+        prepare_database(args.cities, args.routes)
+
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Pool(args.users) as pool:
+        results = pool.starmap(
+            run_user,
+            [
+                (i, args.actions, args.seed * 1000 + i)
+                for i in range(args.users)
+            ],
+        )
+    print_report(results)
+
+
+if __name__ == "__main__":
+    main_load_test()
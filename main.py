@@ -5,11 +5,15 @@ import sys
 
 sys.path.append("tables")
 
-from project_config import ProjectConfig
-from dbconnection import DbConnection
 from city_table import CityTable
+from dbconnection import DbConnection
+from dbtable import DbTable, UpdateConflict
+from excursion_count_table import ExcursionCountTable
+from page_prefetcher import PagePrefetcher
+from project_config import ProjectConfig
+from route_city_table import RouteCityTable
 from route_table import RouteTable
-from dbtable import DbTable
+from tour_price_table import TourPriceTable
 
 
 class Main:
@@ -24,13 +28,28 @@ class Main:
         DbTable.dbconn = self.connection
         self.city_id = -1
         self.city_name = ""
+        self.pages = PagePrefetcher(self.config, self.PAGE_SIZE)
+        self.pages.watch(self.connection)
 
     def db_init(self):
-        """Инициализация таблиц."""
+        """Инициализация таблиц.
+
+        Если агрегат количества экскурсий или каталог цен уже созданы,
+        их триггеры на пересозданных таблицах устанавливаются заново,
+        а каталог пересчитывается.
+        """
         ct = CityTable()
         rt = RouteTable()
-        ct.create()
-        rt.create()
+        ct.create(notify=True)
+        rt.create(notify=True)
+        RouteCityTable().create(notify=True)
+        ect = ExcursionCountTable()
+        if ect.exists():
+            ect.create()
+        tp = TourPriceTable()
+        if tp.exists():
+            tp.create()
+            tp.refresh()
 
     def db_insert_sample_data(self):
         """Вставка тестовых данных."""
@@ -73,10 +92,18 @@ class Main:
             20000.00,
         ])
 
+        rct = RouteCityTable()
+        for route_id, city_id, days in [
+            (1, 1, 2), (1, 3, 2), (2, 1, 1), (2, 2, 3),
+            (3, 2, 3), (4, 3, 2), (5, 4, 5),
+        ]:
+            rct.add_city(route_id, city_id, days)
+
     def db_drop(self):
         """Удаление таблиц."""
         rt = RouteTable()
         ct = CityTable()
+        RouteCityTable().drop()
         rt.drop()
         ct.drop()
 
@@ -108,6 +135,7 @@ class Main:
                 self.db_drop()
                 self.db_init()
                 self.db_insert_sample_data()
+                self.pages.invalidate()
                 print("\n✓ Таблицы созданы заново с тестовыми данными!\n")
             else:
                 print("Операция отменена.")
@@ -119,14 +147,12 @@ class Main:
 
     def show_cities(self, page=1):
         """Просмотр списка городов с пагинацией."""
-        ct = CityTable()
-        total_count = ct.count()
+        total_count = self.pages.count("city")
         total_pages = max(
             1, (total_count + self.PAGE_SIZE - 1) // self.PAGE_SIZE
         )
 
         page = max(1, min(page, total_pages))
-        offset = (page - 1) * self.PAGE_SIZE
 
         print("\n" + "=" * 60)
         print("СПИСОК ГОРОДОВ")
@@ -136,9 +162,10 @@ class Main:
         print(f"{'№':>3} | {'Название города':<50}")
         print("-" * 60)
 
-        lst = ct.all(limit=self.PAGE_SIZE, offset=offset)
+        lst = self.pages.get("city", None, page)
+        self.pages.prefetch("city", None, page, total_pages)
         for idx, city in enumerate(lst, start=1):
-            print(f"{idx:>3} | {city[1]:<50}")
+            print(f"{idx:>3} | {city.name:<50}")
 
         print("-" * 60)
 
@@ -163,12 +190,15 @@ class Main:
         """Обработка выбора в меню городов."""
         if next_step == "3":
             self.show_add_city()
+            self.pages.invalidate()
             return "1", 1
         elif next_step == "4":
             self.show_edit_city()
+            self.pages.invalidate()
             return "1", page
         elif next_step == "5":
             self.show_delete_city()
+            self.pages.invalidate()
             return "1", page
         elif next_step == "6":
             next_step = self.show_routes_by_city()
@@ -234,7 +264,7 @@ class Main:
             print("✗ Город с таким номером не найден!")
             return
 
-        print(f"\nТекущее название: {city[1]}")
+        print(f"\nТекущее название: {city.name}")
         new_name = input(
             "Введите новое название "
             "(0 - отмена, Enter - оставить без изменений): "
@@ -245,9 +275,14 @@ class Main:
             return
 
         if new_name == "":
-            new_name = city[1]
+            new_name = city.name
 
-        if ct.update_by_id(city[0], [new_name]):
+        res = ct.update_by_id(
+            city.id, [new_name], expected_version=city.version
+        )
+        if isinstance(res, UpdateConflict):
+            self.show_update_conflict(res, "Город")
+        elif res:
             print("\n✓ Город успешно обновлен!\n")
 
     def show_delete_city(self):
@@ -274,14 +309,14 @@ class Main:
             print("✗ Город с таким номером не найден!")
             return
 
-        print(f"\nВы действительно хотите удалить город '{city[1]}'?")
+        print(f"\nВы действительно хотите удалить город '{city.name}'?")
         confirm = input(
             "Подтвердите удаление (да/нет): "
         ).strip().lower()
 
         if confirm in ("да", "yes"):
-            if ct.delete_by_id(city[0]):
-                print(f"\n✓ Город '{city[1]}' успешно удален!\n")
+            if ct.delete_by_id(city.id):
+                print(f"\n✓ Город '{city.name}' успешно удален!\n")
         else:
             print("Удаление отменено.")
 
@@ -308,17 +343,15 @@ class Main:
                 print("✗ Город с таким номером не найден!")
                 return "1"
 
-            self.city_id = city[0]
-            self.city_name = city[1]
+            self.city_id = city.id
+            self.city_name = city.name
 
-        rt = RouteTable()
-        total_count = rt.count_by_city_id(self.city_id)
+        total_count = self.pages.count("route", self.city_id)
         total_pages = max(
             1, (total_count + self.PAGE_SIZE - 1) // self.PAGE_SIZE
         )
 
         page = max(1, min(page, total_pages))
-        offset = (page - 1) * self.PAGE_SIZE
 
         print("\n" + "=" * 80)
         print(f"МАРШРУТЫ ИЗ ГОРОДА: {self.city_name}")
@@ -331,22 +364,30 @@ class Main:
         )
         print("-" * 80)
 
-        routes = rt.all_by_city_id(
-            self.city_id, limit=self.PAGE_SIZE, offset=offset
-        )
+        routes = self.pages.get("route", self.city_id, page)
+        self.pages.prefetch("route", self.city_id, page, total_pages)
 
         if not routes:
             print("  Маршруты для этого города отсутствуют.")
         else:
             for idx, route in enumerate(routes, start=1):
-                desc = route[3] if route[3] else "Нет описания"
+                desc = route.description if route.description else "Нет описания"
                 if len(desc) > 30:
                     desc = desc[:27] + "..."
-                price = float(route[4])
+                price = float(route.base_price)
                 print(
-                    f"{idx:>3} | {route[1]:<30} | "
+                    f"{idx:>3} | {route.name:<30} | "
                     f"{desc:<30} | {price:>10.2f}"
                 )
+                if route.itinerary:
+                    cities = ", ".join(
+                        f"{stop['city_name']} ({stop['days']} дн.)"
+                        for stop in route.itinerary
+                    )
+                    print(
+                        f"    | Города: {cities}; "
+                        f"всего {route.itinerary_days_total} дн."
+                    )
 
         print("-" * 80)
 
@@ -370,12 +411,15 @@ class Main:
 
             if next_step == "7":
                 self.show_add_route()
+                self.pages.invalidate()
                 return self.show_routes_by_city(page)
             elif next_step == "8":
                 self.show_edit_route()
+                self.pages.invalidate()
                 return self.show_routes_by_city(page)
             elif next_step == "9":
                 self.show_delete_route()
+                self.pages.invalidate()
                 return self.show_routes_by_city(page)
             elif next_step == "[" and page > 1:
                 return self.show_routes_by_city(page - 1)
@@ -469,7 +513,7 @@ class Main:
             print("✗ Маршрут с таким номером не найден!")
             return
 
-        print(f"\nТекущее название: {route[1]}")
+        print(f"\nТекущее название: {route.name}")
         new_name = input(
             "Введите новое название "
             "(Enter - без изменений, 0 - отмена): "
@@ -478,9 +522,9 @@ class Main:
             print("Операция отменена.")
             return
         if new_name == "":
-            new_name = route[1]
+            new_name = route.name
 
-        print(f"\nТекущее описание: {route[3] if route[3] else 'Нет'}")
+        print(f"\nТекущее описание: {route.description or 'Нет'}")
         new_description = input(
             "Введите новое описание "
             "(Enter - без изменений, 0 - отмена): "
@@ -489,9 +533,9 @@ class Main:
             print("Операция отменена.")
             return
         if new_description == "":
-            new_description = route[3]
+            new_description = route.description
 
-        print(f"\nТекущая цена: {float(route[4]):.2f} руб.")
+        print(f"\nТекущая цена: {float(route.base_price):.2f} руб.")
         new_price = input(
             "Введите новую цену "
             "(Enter - без изменений, 0 - отмена): "
@@ -500,7 +544,7 @@ class Main:
             print("Операция отменена.")
             return
         if new_price == "":
-            new_price = float(route[4])
+            new_price = float(route.base_price)
         else:
             try:
                 new_price = float(new_price)
@@ -512,9 +556,23 @@ class Main:
                 return
 
         route_data = [new_name, self.city_id, new_description, new_price]
-        if rt.update_by_id(route[0], route_data):
+        res = rt.update_by_id(
+            route.id, route_data, expected_version=route.version
+        )
+        if isinstance(res, UpdateConflict):
+            self.show_update_conflict(res, "Маршрут")
+        elif res:
             print("\n✓ Маршрут успешно обновлен!\n")
 
+    def show_update_conflict(self, conflict, what):
+        """Сообщение о записи, измененной другим пользователем."""
+        if conflict.current is None:
+            print(f"\n✗ {what} был удален другим пользователем!\n")
+            return
+        print(f"\n✗ {what} был изменен другим пользователем!")
+        print(f"Текущее название: {conflict.current.name}")
+        print("Изменения не сохранены. Повторите редактирование.\n")
+
     def show_delete_route(self):
         """Удаление маршрута."""
         print("\n--- УДАЛЕНИЕ МАРШРУТА ---")
@@ -539,14 +597,14 @@ class Main:
             print("✗ Маршрут с таким номером не найден!")
             return
 
-        print(f"\nВы действительно хотите удалить маршрут '{route[1]}'?")
+        print(f"\nВы действительно хотите удалить маршрут '{route.name}'?")
         confirm = input(
             "Подтвердите удаление (да/нет): "
         ).strip().lower()
 
         if confirm in ("да", "yes"):
-            if rt.delete_by_id(route[0]):
-                print(f"\n✓ Маршрут '{route[1]}' успешно удален!\n")
+            if rt.delete_by_id(route.id):
+                print(f"\n✓ Маршрут '{route.name}' успешно удален!\n")
         else:
             print("Удаление отменено.")
 
@@ -571,6 +629,7 @@ class Main:
                     next_step, current_page, total_pages
                 )
 
+        self.pages.close()
         print("\n" + "=" * 60)
         print("До свидания! Спасибо за использование системы!")
         print("=" * 60 + "\n")
@@ -0,0 +1,156 @@
+"""Модуль фоновой подгрузки соседних страниц для меню."""
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from city_table import CityTable
+from dbconnection import DbConnection
+from dbtable import DbTable
+from route_table import RouteTable
+
+
+class PagePrefetcher:
+    """Кэш страниц списков с фоновой подгрузкой соседних страниц.
+
+    Ключ кэша - (таблица, ID города, номер страницы). Соседние
+    страницы загружаются в отдельном потоке на собственном
+    соединении, пока пользователь читает текущую страницу.
+    Кэш сбрасывается через invalidate() после своих записей и по
+    событиям изменения таблиц от других пользователей (watch).
+    Записи кэша также устаревают через CACHE_TTL секунд - на случай,
+    если триггеры оповещения не установлены.
+    """
+
+    TABLES = {"city": CityTable, "route": RouteTable}
+    WATCHED_TABLES = ("city", "route", "routecity")
+    CACHE_TTL = 5.0
+
+    def __init__(self, config, page_size):
+        """Инициализация кэша и фонового потока."""
+        self.config = config
+        self.page_size = page_size
+        self.cache = {}
+        self.counts = {}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.dbconn = None
+        self.generation = 0
+        self.stop = None
+
+    def watch(self, dbconn):
+        """Подписка на события изменения таблиц (см. DbConnection.subscribe).
+
+        Любое событие по городам, маршрутам или их городам сбрасывает
+        кэш. События отправляют триггеры create(notify=True).
+        """
+        self.stop = dbconn.subscribe(self.on_change)
+
+    def on_change(self, event):
+        """Сброс кэша по событию изменения таблицы."""
+        if (
+            event.get("table") in self.WATCHED_TABLES
+            or event.get("op") == "RECONNECT"
+        ):
+            self.invalidate()
+
+    def _fresh(self, entry):
+        """Проверка, не устарела ли запись кэша."""
+        return entry is not None and (
+            time.monotonic() - entry[1] < self.CACHE_TTL
+        )
+
+    def _load(self, table, city_id, page, dbconn):
+        """Загрузка страницы через указанное соединение."""
+        t = self.TABLES[table]()
+        t.dbconn = dbconn
+        offset = (page - 1) * self.page_size
+        if table == "route":
+            return t.all_by_city_id(
+                city_id,
+                limit=self.page_size,
+                offset=offset,
+                with_itinerary=True,
+            )
+        return t.all(limit=self.page_size, offset=offset)
+
+    def _load_background(self, table, city_id, page):
+        """Загрузка страницы в фоновом потоке."""
+        try:
+            if self.dbconn is None:
+                self.dbconn = DbConnection(self.config)
+            return self._load(table, city_id, page, self.dbconn)
+        except Exception:
+            return None
+
+    def count(self, table, city_id=None):
+        """Получение количества записей с кэшированием до записи в БД."""
+        key = (table, city_id)
+        with self.lock:
+            entry = self.counts.get(key)
+            generation = self.generation
+        if self._fresh(entry):
+            return entry[0]
+        t = self.TABLES[table]()
+        if table == "route":
+            res = t.count_by_city_id(city_id)
+        else:
+            res = t.count()
+        with self.lock:
+            if generation == self.generation:
+                self.counts[key] = (res, time.monotonic())
+        return res
+
+    def get(self, table, city_id, page):
+        """Получение страницы из кэша или из БД."""
+        key = (table, city_id, page)
+        with self.lock:
+            entry = self.cache.get(key)
+            generation = self.generation
+        rows = entry[0].result() if self._fresh(entry) else None
+        if rows is None:
+            rows = self._load(table, city_id, page, DbTable.dbconn)
+            future = Future()
+            future.set_result(rows)
+            with self.lock:
+                if generation == self.generation:
+                    self.cache[key] = (future, time.monotonic())
+        return rows
+
+    def prefetch(self, table, city_id, page, total_pages):
+        """Запуск фоновой загрузки предыдущей и следующей страниц.
+
+        Страницы той же таблицы вне окна текущей страницы удаляются
+        из кэша, чтобы он оставался небольшим.
+        """
+        window = {
+            (table, city_id, p)
+            for p in (page - 1, page, page + 1)
+            if 1 <= p <= total_pages
+        }
+        with self.lock:
+            for key in list(self.cache):
+                if key[0] == table and key not in window:
+                    del self.cache[key]
+            for key in window:
+                if not self._fresh(self.cache.get(key)):
+                    self.cache[key] = (
+                        self.executor.submit(self._load_background, *key),
+                        time.monotonic(),
+                    )
+
+    def invalidate(self):
+        """Сброс кэша страниц и количеств после записи в БД.
+
+        Загрузки, начатые до сброса, не попадают в кэш.
+        """
+        with self.lock:
+            self.generation += 1
+            self.cache.clear()
+            self.counts.clear()
+
+    def close(self):
+        """Остановка фонового потока, подписки и закрытие соединения."""
+        if self.stop is not None:
+            self.stop.set()
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        self.dbconn = None
@@ -0,0 +1,134 @@
+"""Модуль для работы с таблицей городов маршрутов."""
+from dbtable import DbTable, retrying
+
+
+class RouteCityTable(DbTable):
+    """Класс для работы со связью маршрутов и городов (RouteCity).
+
+    Таблица маршрутов секционирована, и ее первичный ключ включает
+    departure_city_id, поэтому внешний ключ на route(id) невозможен.
+    Связь хранит город отправления маршрута и ссылается на составной
+    ключ route(id, departure_city_id) с каскадным удалением и
+    обновлением.
+    """
+
+    def table_name(self):
+        """Получение имени таблицы городов маршрутов."""
+        return self.dbconn.prefix + "routecity"
+
+    def columns(self):
+        """Структура таблицы городов маршрутов."""
+        return {
+            "route_id": ["INT", "NOT NULL"],
+            "departure_city_id": ["INT", "NOT NULL"],
+            "city_id": ["INT", "NOT NULL", "REFERENCES city(id)"],
+            "days": ["INT", "NOT NULL", "CHECK (days > 0)"],
+        }
+
+    def primary_key(self):
+        """Получение списка колонок первичного ключа."""
+        return ["route_id", "city_id"]
+
+    def table_constraints(self):
+        """Первичный ключ и внешний ключ на секционированные маршруты."""
+        return [
+            "PRIMARY KEY (route_id, city_id)",
+            "FOREIGN KEY (route_id, departure_city_id) "
+            f"REFERENCES {self.dbconn.prefix}route (id, departure_city_id) "
+            "ON DELETE CASCADE ON UPDATE CASCADE",
+        ]
+
+    def indexes(self):
+        """Вторичные индексы городов маршрутов."""
+        return {"routecity_city_id_idx": ["city_id"]}
+
+    @retrying(False, idempotent=False)
+    def add_city(self, route_id, city_id, days):
+        """Добавление города в маршрут или изменение числа дней.
+
+        Город отправления берется из маршрута. Возвращает False,
+        если маршрут не найден.
+        """
+        if not isinstance(days, int) or days <= 0:
+            print("Количество дней должно быть положительным!")
+            return False
+        sql = (
+            f"INSERT INTO {self.table_name()} "
+            "(route_id, departure_city_id, city_id, days) "
+            "SELECT id, departure_city_id, %s, %s "
+            f"FROM {self.dbconn.prefix}route WHERE id = %s "
+            "ON CONFLICT (route_id, city_id) "
+            "DO UPDATE SET days = EXCLUDED.days"
+        )
+        cur = self.dbconn.conn.cursor()
+        try:
+            cur.execute(sql, (city_id, days, route_id))
+            self.dbconn.conn.commit()
+            if cur.rowcount == 0:
+                print("Указанный маршрут не существует!")
+                return False
+            return True
+        except Exception as e:
+            if self.dbconn.is_transient(e):
+                raise
+            self.dbconn.conn.rollback()
+            print(f"Ошибка добавления города в маршрут: {e}")
+            return False
+
+    @retrying(False, idempotent=False)
+    def remove_city(self, route_id, city_id):
+        """Удаление города из маршрута."""
+        sql = (
+            f"DELETE FROM {self.table_name()} "
+            "WHERE route_id = %s AND city_id = %s"
+        )
+        cur = self.dbconn.conn.cursor()
+        try:
+            cur.execute(sql, (route_id, city_id))
+            self.dbconn.conn.commit()
+            return True
+        except Exception as e:
+            if self.dbconn.is_transient(e):
+                raise
+            self.dbconn.conn.rollback()
+            print(f"Ошибка удаления города из маршрута: {e}")
+            return False
+
+    def itinerary_sql(self, route_ref):
+        """Подзапрос маршрута поездки для LATERAL-соединения.
+
+        route_ref - выражение с ID маршрута во внешнем запросе.
+        Возвращает одну строку: itinerary - JSON-массив
+        {"city_id", "city_name", "days"} в порядке ID городов и
+        itinerary_days_total - суммарное число дней.
+        """
+        return (
+            "SELECT COALESCE(json_agg(json_build_object("
+            "'city_id', rc.city_id, 'city_name', ic.name, 'days', rc.days"
+            ") ORDER BY rc.city_id), '[]') AS itinerary, "
+            "COALESCE(SUM(rc.days), 0) AS itinerary_days_total "
+            f"FROM {self.table_name()} rc "
+            f"JOIN {self.dbconn.prefix}city ic ON ic.id = rc.city_id "
+            f"WHERE rc.route_id = {route_ref}"
+        )
+
+    @retrying([])
+    def all_by_route_id(self, route_id):
+        """Получение городов маршрута с их названиями."""
+        sql = (
+            f"SELECT {self.select_list('rc')}, c.name AS city_name "
+            f"FROM {self.table_name()} rc "
+            f"JOIN {self.dbconn.prefix}city c ON c.id = rc.city_id "
+            "WHERE rc.route_id = %s "
+            "ORDER BY rc.city_id"
+        )
+        cur = self.cursor(extra=("city_name",))
+        try:
+            cur.execute(sql, (route_id,))
+            return cur.fetchall()
+        except Exception as e:
+            if self.dbconn.is_transient(e):
+                raise
+            self.dbconn.conn.rollback()
+            print(f"Ошибка получения городов маршрута: {e}")
+            return []
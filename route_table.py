@@ -1,10 +1,15 @@
 """Модуль для работы с таблицей маршрутов."""
-from dbtable import DbTable
+from dbtable import DbTable, retrying
+from route_city_table import RouteCityTable
+from tour_table import TourTable
 
 
 class RouteTable(DbTable):
     """Класс для работы с таблицей маршрутов."""
 
+    PARTITIONS = 8
+    FORM_COLUMNS = ["name", "departure_city_id", "description", "base_price"]
+
     def table_name(self):
         """Получение имени таблицы маршрутов."""
         return self.dbconn.prefix + "route"
@@ -25,58 +30,209 @@ class RouteTable(DbTable):
                 "NOT NULL",
                 "CHECK (base_price >= 0)",
             ],
+            "version": ["INT", "NOT NULL", "DEFAULT 1"],
         }
 
+    def indexes(self):
+        """Вторичные индексы маршрутов."""
+        return {"route_departure_city_id_idx": ["departure_city_id", "id"]}
+
+    def partitioning(self):
+        """Секционирование маршрутов по городу отправления.
+
+        Запросы all_by_city_id и count_by_city_id фильтруют по ключу
+        секционирования и читают только одну секцию. Первичный ключ
+        становится (id, departure_city_id), поэтому внешние ключи
+        на route(id) невозможны: RouteCity ссылается на составной
+        ключ, а туры проверяются в delete_by_id и delete_many.
+        """
+        return {
+            "method": "HASH",
+            "columns": ["departure_city_id"],
+            "partitions": self.PARTITIONS,
+        }
+
+    def form_to_columns(self, vals):
+        """Перестановка значений из порядка формы в порядок колонок.
+
+        Меню передает значения в порядке FORM_COLUMNS, а базовые
+        insert_one и update_by_id - в порядке column_names_without_id().
+        """
+        fields = dict(zip(self.FORM_COLUMNS, vals))
+        return [fields[col] for col in self.column_names_without_id()]
+
     def validate_route_data(self, vals):
         """Валидация данных маршрута."""
         name, city_id, description, base_price = vals
+        return self.validate_route_fields({
+            "name": name,
+            "departure_city_id": city_id,
+            "description": description,
+            "base_price": base_price,
+        })
 
-        if not name or len(name.strip()) == 0:
-            return False, "Название маршрута не может быть пустым!"
-        if len(name) > 255:
-            return False, "Название слишком длинное (максимум 255)!"
+    def validate_route_fields(self, fields, check_city=True):
+        """Валидация переданных полей маршрута.
 
-        if not isinstance(city_id, int) or city_id <= 0:
-            return False, "Некорректный ID города!"
+        Проверяются только колонки, присутствующие в fields.
+        При check_city=False существование города не проверяется.
+        """
+        if "name" in fields:
+            name = fields["name"]
+            if not name or len(name.strip()) == 0:
+                return False, "Название маршрута не может быть пустым!"
+            if len(name) > 255:
+                return False, "Название слишком длинное (максимум 255)!"
 
-        sql = f"SELECT COUNT(*) FROM {self.dbconn.prefix}city WHERE id = %s"
-        cur = self.dbconn.conn.cursor()
-        cur.execute(sql, (city_id,))
-        if cur.fetchone()[0] == 0:
-            return False, "Указанный город не существует!"
+        if "departure_city_id" in fields:
+            city_id = fields["departure_city_id"]
+            if not isinstance(city_id, int) or city_id <= 0:
+                return False, "Некорректный ID города!"
+
+            if check_city:
+                sql = (
+                    f"SELECT COUNT(*) FROM {self.dbconn.prefix}city "
+                    "WHERE id = %s"
+                )
+                cur = self.dbconn.conn.cursor()
+                cur.execute(sql, (city_id,))
+                if cur.fetchone()[0] == 0:
+                    return False, "Указанный город не существует!"
 
+        description = fields.get("description")
         if description and len(description) > 5000:
             return False, "Описание слишком длинное (максимум 5000)!"
 
-        try:
-            price = float(base_price)
-            if price < 0:
-                return False, "Цена не может быть отрицательной!"
-        except (ValueError, TypeError):
-            return False, "Некорректное значение цены!"
+        if "base_price" in fields:
+            try:
+                price = float(fields["base_price"])
+                if price < 0:
+                    return False, "Цена не может быть отрицательной!"
+            except (ValueError, TypeError):
+                return False, "Некорректное значение цены!"
 
         return True, ""
 
+    @retrying(False, idempotent=False)
     def insert_one(self, vals):
         """Вставка маршрута с валидацией."""
         valid, error = self.validate_route_data(vals)
         if not valid:
             print(error)
             return False
-        return super().insert_one(vals)
+        return super().insert_one(self.form_to_columns(vals))
 
-    def update_by_id(self, id_val, vals):
+    @retrying(False, idempotent=False)
+    def update_by_id(self, id_val, vals, expected_version=None):
         """Обновление маршрута с валидацией."""
         valid, error = self.validate_route_data(vals)
         if not valid:
             print(error)
             return False
-        return super().update_by_id(id_val, vals)
+        return super().update_by_id(
+            id_val, self.form_to_columns(vals), expected_version
+        )
 
-    def all_by_city_id(self, city_id, limit=None, offset=None):
-        """Получение маршрутов для города."""
+    @retrying([], idempotent=False)
+    def update_many(self, items, columns=None):
+        """Массовое обновление маршрутов с валидацией.
+
+        Без columns значения передаются в порядке FORM_COLUMNS, как
+        в insert_one и update_by_id. Город проверяется одним запросом
+        для всего набора.
+        """
+        if columns is None:
+            items = [
+                (id_val, self.form_to_columns(vals)) for id_val, vals in items
+            ]
+        cols = columns or self.column_names_without_id()
+        city_ids = set()
+        for _, vals in items:
+            fields = dict(zip(cols, vals))
+            valid, error = self.validate_route_fields(fields, check_city=False)
+            if not valid:
+                print(error)
+                return []
+            if "departure_city_id" in fields:
+                city_ids.add(fields["departure_city_id"])
+        if city_ids:
+            sql = (
+                f"SELECT COUNT(*) FROM {self.dbconn.prefix}city "
+                "WHERE id = ANY(%s)"
+            )
+            cur = self.dbconn.conn.cursor()
+            cur.execute(sql, (list(city_ids),))
+            if cur.fetchone()[0] != len(city_ids):
+                print("Указанный город не существует!")
+                return []
+        return super().update_many(items, columns)
+
+    @retrying({})
+    def tours_count_by_route_ids(self, ids):
+        """Количество туров для каждого маршрута из списка.
+
+        Возвращает словарь {id маршрута: количество} только для
+        маршрутов, у которых есть туры. Если таблицы туров нет,
+        возвращается пустой словарь.
+        """
+        tours = TourTable()
+        tours.dbconn = self.dbconn
+        if not tours.exists():
+            return {}
         sql = (
-            f"SELECT r.*, c.name as city_name "
+            f"SELECT route_id, COUNT(*) FROM {tours.table_name()} "
+            "WHERE route_id = ANY(%s) GROUP BY route_id"
+        )
+        cur = self.dbconn.conn.cursor()
+        cur.execute(sql, (list(ids),))
+        return dict(cur.fetchall())
+
+    @retrying(False, idempotent=False)
+    def delete_by_id(self, id_val):
+        """Удаление маршрута с проверкой туров.
+
+        Внешний ключ tour.route_id на секционированную таблицу
+        маршрутов невозможен, поэтому связь проверяется здесь.
+        """
+        count = self.tours_count_by_route_ids([id_val]).get(id_val, 0)
+        if count > 0:
+            print(f"Невозможно удалить: существует {count} тур(ов)!")
+            print("Сначала удалите связанные туры.")
+            return False
+        return super().delete_by_id(id_val)
+
+    @retrying([], idempotent=False)
+    def delete_many(self, ids):
+        """Массовое удаление маршрутов с проверкой туров.
+
+        Маршруты с турами не удаляются; их ID выводятся в сообщении.
+        Возвращает список ID удаленных маршрутов.
+        """
+        blocked = self.tours_count_by_route_ids(ids)
+        if blocked:
+            print(
+                "Невозможно удалить маршруты с турами (ID): "
+                + ", ".join(str(i) for i in sorted(blocked))
+            )
+            print("Сначала удалите связанные туры.")
+        allowed = [i for i in ids if i not in blocked]
+        if not allowed:
+            return []
+        return super().delete_many(allowed)
+
+    @retrying([])
+    def all_by_city_id(
+        self, city_id, limit=None, offset=None, with_itinerary=False
+    ):
+        """Получение маршрутов для города.
+
+        При with_itinerary=True к строкам добавляются itinerary
+        (список городов маршрута с числом дней) и
+        itinerary_days_total. Они вычисляются в том же запросе
+        LATERAL-соединением только для строк текущей страницы.
+        """
+        sql = (
+            f"SELECT {self.select_list('r')}, c.name AS city_name "
             f"FROM {self.table_name()} r "
             f"JOIN {self.dbconn.prefix}city c "
             "ON r.departure_city_id = c.id "
@@ -90,15 +246,30 @@ class RouteTable(DbTable):
             if offset is not None:
                 sql += " OFFSET %s"
                 params.append(offset)
+        extra = ("city_name",)
+        if with_itinerary:
+            rc = RouteCityTable()
+            rc.dbconn = self.dbconn
+            sql = (
+                "SELECT p.*, it.itinerary, it.itinerary_days_total "
+                f"FROM ({sql}) p "
+                f"CROSS JOIN LATERAL ({rc.itinerary_sql('p.id')}) it "
+                "ORDER BY p.id"
+            )
+            extra += ("itinerary", "itinerary_days_total")
 
-        cur = self.dbconn.conn.cursor()
+        cur = self.cursor(extra=extra)
         try:
             cur.execute(sql, params)
             return cur.fetchall()
         except Exception as e:
+            if self.dbconn.is_transient(e):
+                raise
+            self.dbconn.conn.rollback()
             print(f"Ошибка получения маршрутов: {e}")
             return []
 
+    @retrying(0)
     def count_by_city_id(self, city_id):
         """Подсчет маршрутов для города."""
         sql = (
@@ -110,10 +281,28 @@ class RouteTable(DbTable):
         result = cur.fetchone()
         return result[0] if result else 0
 
+    def export_by_city_id(self, city_id, path_or_stream, **kwargs):
+        """Потоковая выгрузка маршрутов города (см. DbTable.export)."""
+        return self.export(
+            path_or_stream,
+            where="departure_city_id = %s",
+            params=(city_id,),
+            **kwargs,
+        )
+
+    def warm_start_by_city_ids(self, path, city_ids):
+        """Загрузка маршрутов городов из снимка (см. DbTable.warm_start)."""
+        return self.warm_start(
+            path,
+            where="departure_city_id = ANY(%s)",
+            params=(sorted(city_ids),),
+        )
+
+    @retrying()
     def find_route_by_position_and_city(self, city_id, position):
         """Получение маршрута по позиции для города."""
         sql = (
-            f"SELECT r.*, c.name as city_name "
+            f"SELECT {self.select_list('r')}, c.name AS city_name "
             f"FROM {self.table_name()} r "
             f"JOIN {self.dbconn.prefix}city c "
             "ON r.departure_city_id = c.id "
@@ -121,10 +310,13 @@ class RouteTable(DbTable):
             "ORDER BY r.id "
             "LIMIT 1 OFFSET %s"
         )
-        cur = self.dbconn.conn.cursor()
+        cur = self.cursor(extra=("city_name",))
         try:
             cur.execute(sql, (city_id, position - 1))
             return cur.fetchone()
         except Exception as e:
+            if self.dbconn.is_transient(e):
+                raise
+            self.dbconn.conn.rollback()
             print(f"Ошибка получения маршрута: {e}")
             return None
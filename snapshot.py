@@ -0,0 +1,173 @@
+"""Модуль двоичных снимков справочных данных для быстрого старта."""
+import json
+import mmap
+import os
+import struct
+from array import array
+from decimal import Decimal
+
+
+def _aligned(pos):
+    """Выравнивание смещения по границе 8 байт."""
+    return (pos + 7) // 8 * 8
+
+
+class Snapshot:
+    """Двоичный снимок строк таблицы, открываемый через mmap.
+
+    Формат файла: сигнатура, длина и JSON-каталог секций, затем
+    выровненные по 8 байт секции колонок. Целые колонки ("i") и суммы
+    в копейках ("c") хранятся массивами int64, строковые ("s") -
+    массивом признаков NULL, массивом смещений int64 и общим блоком
+    UTF-8. При открытии строки не разбираются: значения читаются
+    из памяти по индексу при обращении.
+    """
+
+    MAGIC = b"DBSNAP01"
+    HEADER = struct.Struct("<8sQ")
+
+    def __init__(self, path, row_class=None):
+        """Открытие снимка через mmap."""
+        self.row_class = row_class
+        self.file = open(path, "rb")
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, dir_len = self.HEADER.unpack_from(self.mm, 0)
+        if magic != self.MAGIC:
+            self.close()
+            raise ValueError("Некорректный формат снимка")
+        start = self.HEADER.size
+        self.directory = json.loads(self.mm[start:start + dir_len])
+        self.marker = self.directory["marker"]
+        self.filter = self.directory["filter"]
+        self.rows = self.directory["rows"]
+        base = _aligned(start + dir_len)
+        self.views = [memoryview(self.mm)]
+        self.columns = {}
+        for col in self.directory["columns"]:
+            if col["kind"] in ("i", "c"):
+                data = self._view(base + col["data"], 8 * self.rows, "q")
+            else:
+                data = (
+                    self._view(base + col["nulls"], self.rows),
+                    self._view(base + col["offsets"], 8 * (self.rows + 1), "q"),
+                    self._view(base + col["blob"], col["blob_len"]),
+                )
+            self.columns[col["name"]] = (col["kind"], data)
+
+    def _view(self, offset, size, fmt=None):
+        """Представление участка файла без копирования."""
+        view = self.views[0][offset:offset + size]
+        self.views.append(view)
+        if fmt:
+            view = view.cast(fmt)
+            self.views.append(view)
+        return view
+
+    @classmethod
+    def write(cls, path, marker, filter, kinds, rows):
+        """Запись снимка строк rows в файл path.
+
+        kinds - список пар (имя колонки, вид "i", "c" или "s")
+        в порядке значений в строках. Смещения секций в каталоге
+        отсчитываются от начала области данных после каталога.
+        """
+        columns = []
+        chunks = []
+        pos = 0
+
+        def place(data):
+            nonlocal pos
+            offset = pos
+            chunks.append((offset, data))
+            pos = _aligned(pos + len(data))
+            return offset
+
+        for idx, (name, kind) in enumerate(kinds):
+            if kind == "i":
+                data = array("q", (r[idx] for r in rows)).tobytes()
+                columns.append(
+                    {"name": name, "kind": kind, "data": place(data)}
+                )
+            elif kind == "c":
+                data = array("q", (int(r[idx] * 100) for r in rows))
+                data = data.tobytes()
+                columns.append(
+                    {"name": name, "kind": kind, "data": place(data)}
+                )
+            else:
+                nulls = bytearray(len(rows))
+                offsets = array("q", [0])
+                blob = bytearray()
+                for i, r in enumerate(rows):
+                    if r[idx] is None:
+                        nulls[i] = 1
+                    else:
+                        blob += r[idx].encode("utf-8")
+                    offsets.append(len(blob))
+                columns.append({
+                    "name": name,
+                    "kind": kind,
+                    "nulls": place(nulls),
+                    "offsets": place(offsets.tobytes()),
+                    "blob": place(blob),
+                    "blob_len": len(blob),
+                })
+
+        directory = json.dumps({
+            "marker": list(marker),
+            "filter": filter,
+            "rows": len(rows),
+            "columns": columns,
+        }, ensure_ascii=False).encode("utf-8")
+        base = _aligned(cls.HEADER.size + len(directory))
+
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(cls.HEADER.pack(cls.MAGIC, len(directory)))
+            f.write(directory)
+            for offset, data in chunks:
+                f.seek(base + offset)
+                f.write(data)
+            f.truncate(base + pos)
+        os.replace(tmp, path)
+
+    def value(self, name, i):
+        """Получение значения колонки name строки i."""
+        kind, data = self.columns[name]
+        if kind == "i":
+            return data[i]
+        if kind == "c":
+            return Decimal(data[i]).scaleb(-2)
+        nulls, offsets, blob = data
+        if nulls[i]:
+            return None
+        return str(blob[offsets[i]:offsets[i + 1]], "utf-8")
+
+    def column(self, name):
+        """Массив значений целой колонки без копирования."""
+        return self.columns[name][1]
+
+    def __len__(self):
+        """Количество строк в снимке."""
+        return self.rows
+
+    def __getitem__(self, i):
+        """Получение строки снимка по индексу."""
+        if not 0 <= i < self.rows:
+            raise IndexError(i)
+        values = [self.value(name, i) for name in self.columns]
+        if self.row_class is None:
+            return tuple(values)
+        return self.row_class(*values)
+
+    def __iter__(self):
+        """Итерация по строкам снимка."""
+        return (self[i] for i in range(self.rows))
+
+    def close(self):
+        """Закрытие отображения и файла."""
+        self.columns = {}
+        for view in reversed(getattr(self, "views", [])):
+            view.release()
+        self.mm.close()
+        self.file.close()
@@ -0,0 +1,370 @@
+"""Модуль для работы с каталогом цен туров."""
+from dbtable import DbTable, retrying
+
+
+class TourPriceTable(DbTable):
+    """Класс материализованного каталога цен туров.
+
+    Цена тура складывается из базовой цены маршрута, цен всех
+    экскурсий в городах маршрута и дополнительных взносов тура.
+    Цены в валютах пересчитываются по курсам из таблицы currency_rate
+    с округлением вверх, как в запросах task_1_2.txt.
+    """
+
+    def table_name(self):
+        """Получение имени таблицы цен в рублях."""
+        return self.dbconn.prefix + "tour_price"
+
+    def currency_table_name(self):
+        """Получение имени таблицы цен в валютах."""
+        return self.dbconn.prefix + "tour_price_currency"
+
+    def rate_table_name(self):
+        """Получение имени таблицы курсов валют."""
+        return self.dbconn.prefix + "currency_rate"
+
+    def columns(self):
+        """Структура таблицы цен в рублях."""
+        return {
+            "tour_id": ["INT", "PRIMARY KEY"],
+            "route_id": ["INT", "NOT NULL"],
+            "base_price": ["NUMERIC(12, 2)", "NOT NULL"],
+            "excursions_price": ["NUMERIC(12, 2)", "NOT NULL"],
+            "extra_fees": ["NUMERIC(12, 2)", "NOT NULL"],
+            "total_rub": ["NUMERIC(12, 2)", "NOT NULL"],
+        }
+
+    def primary_key(self):
+        """Получение списка колонок первичного ключа."""
+        return ["tour_id"]
+
+    def create(self, notify=False):
+        """Создание таблиц каталога цен, функции пересчета и триггеров.
+
+        Триггеры на Route, RouteCity, Excursion, Tour и currency_rate
+        пересчитывают только затронутые туры (tour_price_refresh).
+        Строки туров, которых больше нет или маршрут которых удален,
+        удаляются из каталога. Триггеры удаляются вместе с исходными
+        таблицами, поэтому после их пересоздания create() нужно
+        вызвать снова.
+        """
+        super().create(notify)
+        p = self.dbconn.prefix
+        sql_list = [
+            f"CREATE TABLE IF NOT EXISTS {self.rate_table_name()} ("
+            "code VARCHAR(3) PRIMARY KEY, "
+            "rate NUMERIC(12, 6) NOT NULL CHECK (rate > 0))",
+            f"CREATE TABLE IF NOT EXISTS {self.currency_table_name()} ("
+            f"tour_id INT NOT NULL REFERENCES {self.table_name()}(tour_id) "
+            "ON DELETE CASCADE, "
+            "currency VARCHAR(3) NOT NULL, "
+            "total NUMERIC(12, 2) NOT NULL, "
+            "PRIMARY KEY (currency, tour_id))",
+            "CREATE INDEX IF NOT EXISTS tour_price_route_id_idx "
+            f"ON {self.table_name()} (route_id)",
+            "CREATE INDEX IF NOT EXISTS tour_price_currency_tour_id_idx "
+            f"ON {self.currency_table_name()} (tour_id)",
+            f"CREATE OR REPLACE FUNCTION {p}tour_price_refresh("
+            "r_ids INT[], t_ids INT[]) RETURNS void AS $$ "
+            "DECLARE ids INT[]; BEGIN "
+            "SELECT array_agg(DISTINCT u.id) INTO ids FROM ("
+            f"SELECT id FROM {p}tour WHERE route_id = ANY(r_ids) "
+            f"UNION SELECT tour_id FROM {self.table_name()} "
+            "WHERE route_id = ANY(r_ids) "
+            "UNION SELECT unnest(t_ids)) u (id); "
+            "IF ids IS NULL THEN RETURN; END IF; "
+            f"DELETE FROM {self.table_name()} tp "
+            "WHERE tp.tour_id = ANY(ids) AND NOT EXISTS ("
+            f"SELECT 1 FROM {p}tour t JOIN {p}route r ON r.id = t.route_id "
+            "WHERE t.id = tp.tour_id); "
+            f"{self._price_sql('t.id = ANY(ids)')}; "
+            f"{self._currency_sql('tp.tour_id = ANY(ids)')}; "
+            "END $$ LANGUAGE plpgsql",
+            f"CREATE OR REPLACE FUNCTION {p}tour_price_on_route() "
+            "RETURNS trigger AS $$ BEGIN "
+            "IF TG_OP = 'DELETE' THEN "
+            f"PERFORM {p}tour_price_refresh(ARRAY[OLD.id], '{{}}'); "
+            "ELSE "
+            f"PERFORM {p}tour_price_refresh(ARRAY[NEW.id], '{{}}'); "
+            "END IF; "
+            "RETURN NULL; END $$ LANGUAGE plpgsql",
+            f"CREATE OR REPLACE FUNCTION {p}tour_price_on_route_city() "
+            "RETURNS trigger AS $$ BEGIN "
+            "IF TG_OP IN ('UPDATE', 'DELETE') THEN "
+            f"PERFORM {p}tour_price_refresh(ARRAY[OLD.route_id], '{{}}'); "
+            "END IF; "
+            "IF TG_OP IN ('INSERT', 'UPDATE') THEN "
+            f"PERFORM {p}tour_price_refresh(ARRAY[NEW.route_id], '{{}}'); "
+            "END IF; "
+            "RETURN NULL; END $$ LANGUAGE plpgsql",
+            f"CREATE OR REPLACE FUNCTION {p}tour_price_on_excursion() "
+            "RETURNS trigger AS $$ DECLARE c_ids INT[]; BEGIN "
+            "IF TG_OP = 'INSERT' THEN c_ids := ARRAY[NEW.city_id]; "
+            "ELSIF TG_OP = 'DELETE' THEN c_ids := ARRAY[OLD.city_id]; "
+            "ELSE c_ids := ARRAY[OLD.city_id, NEW.city_id]; END IF; "
+            f"PERFORM {p}tour_price_refresh(ARRAY("
+            f"SELECT DISTINCT route_id FROM {p}routecity "
+            "WHERE city_id = ANY(c_ids)), '{}'); "
+            "RETURN NULL; END $$ LANGUAGE plpgsql",
+            f"CREATE OR REPLACE FUNCTION {p}tour_price_on_tour() "
+            "RETURNS trigger AS $$ BEGIN "
+            "IF TG_OP = 'DELETE' THEN "
+            f"PERFORM {p}tour_price_refresh('{{}}', ARRAY[OLD.id]); "
+            "ELSE "
+            f"PERFORM {p}tour_price_refresh('{{}}', ARRAY[NEW.id]); "
+            "END IF; "
+            "RETURN NULL; END $$ LANGUAGE plpgsql",
+            f"CREATE OR REPLACE FUNCTION {p}tour_price_on_rate() "
+            "RETURNS trigger AS $$ BEGIN "
+            "IF TG_OP IN ('UPDATE', 'DELETE') THEN "
+            f"DELETE FROM {self.currency_table_name()} "
+            "WHERE currency = OLD.code; "
+            "END IF; "
+            "IF TG_OP IN ('INSERT', 'UPDATE') THEN "
+            f"{self._currency_sql('cr.code = NEW.code')}; "
+            "END IF; "
+            "RETURN NULL; END $$ LANGUAGE plpgsql",
+        ]
+        triggers = {
+            "route": (
+                "DELETE OR UPDATE OF base_price", "tour_price_on_route"
+            ),
+            "routecity": (
+                "INSERT OR DELETE OR UPDATE OF route_id, city_id",
+                "tour_price_on_route_city",
+            ),
+            "excursion": (
+                "INSERT OR DELETE OR UPDATE OF city_id, price",
+                "tour_price_on_excursion",
+            ),
+            "tour": (
+                "INSERT OR DELETE OR UPDATE OF route_id, extra_fees",
+                "tour_price_on_tour",
+            ),
+            "currency_rate": (
+                "INSERT OR DELETE OR UPDATE", "tour_price_on_rate"
+            ),
+        }
+        for table, (events, func) in triggers.items():
+            sql_list += [
+                f"DROP TRIGGER IF EXISTS tour_price_trg ON {p}{table}",
+                f"CREATE TRIGGER tour_price_trg AFTER {events} "
+                f"ON {p}{table} FOR EACH ROW "
+                f"EXECUTE FUNCTION {p}{func}()",
+            ]
+        cur = self.dbconn.conn.cursor()
+        try:
+            for sql in sql_list:
+                cur.execute(sql)
+            self.dbconn.conn.commit()
+        except Exception as e:
+            self.dbconn.conn.rollback()
+            print(f"Ошибка создания каталога цен: {e}")
+
+    def drop(self):
+        """Удаление таблиц каталога цен, функций и триггеров."""
+        p = self.dbconn.prefix
+        sql_list = [
+            f"DROP FUNCTION IF EXISTS {p}{func}() CASCADE"
+            for func in (
+                "tour_price_on_route",
+                "tour_price_on_route_city",
+                "tour_price_on_excursion",
+                "tour_price_on_tour",
+                "tour_price_on_rate",
+            )
+        ]
+        sql_list += [
+            f"DROP FUNCTION IF EXISTS {p}tour_price_refresh(INT[], INT[])",
+            f"DROP TABLE IF EXISTS {self.currency_table_name()}, "
+            f"{self.rate_table_name()} CASCADE",
+        ]
+        cur = self.dbconn.conn.cursor()
+        try:
+            for sql in sql_list:
+                cur.execute(sql)
+            self.dbconn.conn.commit()
+        except Exception as e:
+            self.dbconn.conn.rollback()
+            print(f"Ошибка удаления каталога цен: {e}")
+        super().drop()
+
+    def _price_sql(self, where):
+        """Запрос расчета цен туров, отобранных условием where.
+
+        Существующие строки каталога обновляются (ON CONFLICT), поэтому
+        тур, перенесенный на другой маршрут, пересчитывается без
+        конфликта ключа.
+        """
+        p = self.dbconn.prefix
+        return (
+            f"INSERT INTO {self.table_name()} "
+            "(tour_id, route_id, base_price, excursions_price, "
+            "extra_fees, total_rub) "
+            "SELECT t.id, t.route_id, r.base_price, "
+            "COALESCE(re.excursions_price, 0), "
+            "COALESCE(t.extra_fees, 0), "
+            "r.base_price + COALESCE(re.excursions_price, 0) "
+            "+ COALESCE(t.extra_fees, 0) "
+            f"FROM {p}tour t "
+            f"JOIN {p}route r ON r.id = t.route_id "
+            "LEFT JOIN LATERAL ("
+            "SELECT SUM(e.price) AS excursions_price "
+            f"FROM {p}routecity rc "
+            f"JOIN {p}excursion e ON e.city_id = rc.city_id "
+            "WHERE rc.route_id = t.route_id"
+            ") re ON TRUE "
+            f"WHERE {where} "
+            "ON CONFLICT (tour_id) DO UPDATE SET "
+            "route_id = EXCLUDED.route_id, "
+            "base_price = EXCLUDED.base_price, "
+            "excursions_price = EXCLUDED.excursions_price, "
+            "extra_fees = EXCLUDED.extra_fees, "
+            "total_rub = EXCLUDED.total_rub"
+        )
+
+    def _currency_sql(self, where):
+        """Запрос пересчета цен в валюты для строк каталога."""
+        return (
+            f"INSERT INTO {self.currency_table_name()} "
+            "(tour_id, currency, total) "
+            "SELECT tp.tour_id, cr.code, CEIL(tp.total_rub * cr.rate) "
+            f"FROM {self.table_name()} tp "
+            f"CROSS JOIN {self.rate_table_name()} cr "
+            f"WHERE {where} "
+            "ON CONFLICT (currency, tour_id) "
+            "DO UPDATE SET total = EXCLUDED.total"
+        )
+
+    @retrying(False)
+    def _execute_refresh(self, sql_list):
+        """Выполнение запросов обновления каталога в одной транзакции."""
+        cur = self.dbconn.conn.cursor()
+        try:
+            for sql, params in sql_list:
+                cur.execute(sql, params)
+            self.dbconn.conn.commit()
+            return True
+        except Exception as e:
+            if self.dbconn.is_transient(e):
+                raise
+            self.dbconn.conn.rollback()
+            print(f"Ошибка обновления каталога цен: {e}")
+            return False
+
+    def refresh(self, rates=None):
+        """Полный пересчет каталога одним проходом.
+
+        rates - необязательный словарь курсов {код валюты: курс},
+        сохраняемый перед пересчетом.
+        """
+        sql_list = [
+            (self._rate_upsert_sql(), (code, rate))
+            for code, rate in (rates or {}).items()
+        ]
+        sql_list += [
+            (
+                f"TRUNCATE {self.table_name()}, "
+                f"{self.currency_table_name()}",
+                None,
+            ),
+            (self._price_sql("TRUE"), None),
+            (self._currency_sql("TRUE"), None),
+        ]
+        return self._execute_refresh(sql_list)
+
+    def refresh_by_route_ids(self, route_ids):
+        """Пересчет цен туров по маршрутам.
+
+        Пересчитываются туры, которые сейчас или ранее относились
+        к маршрутам; строки удаленных туров и туров удаленных
+        маршрутов удаляются. Изменения
+        через приложение и SQL пересчитываются триггерами, метод
+        нужен для ручного пересчета.
+        """
+        return self._execute_refresh([(
+            f"SELECT {self.dbconn.prefix}tour_price_refresh(%s, %s)",
+            (list(route_ids), []),
+        )])
+
+    @retrying(False)
+    def refresh_by_city_ids(self, city_ids):
+        """Пересчет цен туров после изменения экскурсий в городах."""
+        sql = (
+            f"SELECT DISTINCT route_id FROM {self.dbconn.prefix}routecity "
+            "WHERE city_id = ANY(%s)"
+        )
+        cur = self.dbconn.conn.cursor()
+        cur.execute(sql, (list(city_ids),))
+        route_ids = [row[0] for row in cur.fetchall()]
+        if not route_ids:
+            return True
+        return self.refresh_by_route_ids(route_ids)
+
+    def _rate_upsert_sql(self):
+        """Запрос сохранения курса валюты."""
+        return (
+            f"INSERT INTO {self.rate_table_name()} (code, rate) "
+            "VALUES (%s, %s) "
+            "ON CONFLICT (code) DO UPDATE SET rate = EXCLUDED.rate"
+        )
+
+    def set_rate(self, code, rate):
+        """Изменение курса валюты с пересчетом только ее цен.
+
+        Цены в валюте пересчитывает триггер на currency_rate. Цены
+        в рублях уже хранятся в каталоге, поэтому соединения
+        с маршрутами и экскурсиями не выполняются.
+        """
+        return self._execute_refresh([
+            (self._rate_upsert_sql(), (code, rate)),
+        ])
+
+    @retrying()
+    def price_by_tour_id(self, tour_id, currency=None):
+        """Получение цены тура в рублях или в указанной валюте."""
+        if currency is None:
+            sql = (
+                f"SELECT total_rub FROM {self.table_name()} "
+                "WHERE tour_id = %s"
+            )
+            params = (tour_id,)
+        else:
+            sql = (
+                f"SELECT total FROM {self.currency_table_name()} "
+                "WHERE currency = %s AND tour_id = %s"
+            )
+            params = (currency, tour_id)
+        cur = self.dbconn.conn.cursor()
+        cur.execute(sql, params)
+        result = cur.fetchone()
+        return result[0] if result else None
+
+    @retrying([])
+    def all_with_currency(self, currency, limit=None, offset=None):
+        """Получение каталога цен с ценой в указанной валюте."""
+        sql = (
+            f"SELECT {self.select_list('tp')}, tpc.total "
+            f"FROM {self.table_name()} tp "
+            f"JOIN {self.currency_table_name()} tpc "
+            "ON tpc.tour_id = tp.tour_id AND tpc.currency = %s "
+            "ORDER BY tp.tour_id"
+        )
+        params = [currency]
+        if limit is not None:
+            sql += " LIMIT %s"
+            params.append(limit)
+            if offset is not None:
+                sql += " OFFSET %s"
+                params.append(offset)
+
+        cur = self.cursor(extra=("total",))
+        try:
+            cur.execute(sql, params)
+            return cur.fetchall()
+        except Exception as e:
+            if self.dbconn.is_transient(e):
+                raise
+            self.dbconn.conn.rollback()
+            print(f"Ошибка получения каталога цен: {e}")
+            return []
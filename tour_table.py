@@ -0,0 +1,35 @@
+"""Модуль для работы с таблицей туров."""
+from dbtable import DbTable
+
+
+class TourTable(DbTable):
+    """Класс для работы с таблицей туров (структура из task_1_2.txt).
+
+    Таблица маршрутов секционирована, и id маршрута не уникален сам
+    по себе, поэтому внешний ключ route_id на route(id) невозможен.
+    Удаление маршрутов с турами запрещают RouteTable.delete_by_id
+    и RouteTable.delete_many.
+    """
+
+    def table_name(self):
+        """Получение имени таблицы туров."""
+        return self.dbconn.prefix + "tour"
+
+    def columns(self):
+        """Структура таблицы туров."""
+        return {
+            "id": ["SERIAL", "PRIMARY KEY"],
+            "route_id": ["INT", "NOT NULL"],
+            "start_date": ["DATE", "NOT NULL"],
+            "duration_days": [
+                "INT",
+                "NOT NULL",
+                "CHECK (duration_days > 0)",
+            ],
+            "extra_fees": [
+                "NUMERIC(10, 2)",
+                "DEFAULT 0",
+                "CHECK (extra_fees >= 0)",
+            ],
+            "extra_description": ["TEXT"],
+        }